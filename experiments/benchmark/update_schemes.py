@@ -0,0 +1,45 @@
+"""
+Benchmark of the throughput of the sequential and synchronous update schemes.
+"""
+
+import contextlib
+import io
+import time
+
+from build import config as cfg
+from build import object_factory
+
+SCHEMES = [
+    ("sequential, object engine", {cfg.ENGINE: cfg.ENGINE_OBJECT, cfg.UPDATE_SCHEME: cfg.UPDATE_SEQUENTIAL}),
+    ("sequential, array engine", {cfg.ENGINE: cfg.ENGINE_ARRAY, cfg.UPDATE_SCHEME: cfg.UPDATE_SEQUENTIAL}),
+    ("synchronous, array engine", {cfg.ENGINE: cfg.ENGINE_ARRAY, cfg.UPDATE_SCHEME: cfg.UPDATE_SYNCHRONOUS}),
+]
+
+GC_COUNTS = [25, 100, 400]
+STEP_NUM = 500
+
+
+def benchmark(gc_count, scheme_config):
+    """
+    Run a continuous gradient simulation and return its throughput in growth cone steps per second.
+    """
+    config = dict(cfg.default_configs["CONTINUOUS_GRADIENTS"])
+    config.update({cfg.GC_COUNT: gc_count, cfg.STEP_NUM: STEP_NUM, cfg.ROWS: 4 * gc_count, cfg.SEED: 0})
+    config.update(scheme_config)
+    simulation = object_factory.build_simulation(config)
+
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation.run()
+    return gc_count * STEP_NUM / (time.time() - start_time)
+
+
+def run():
+    print(f"{'growth cones':>12}  " + "  ".join(f"{name:>26}" for name, _ in SCHEMES))
+    for gc_count in GC_COUNTS:
+        throughputs = [benchmark(gc_count, scheme_config) for _, scheme_config in SCHEMES]
+        print(f"{gc_count:>12}  " + "  ".join(f"{throughput:>20.0f} steps/s" for throughput in throughputs))
+
+
+if __name__ == '__main__':
+    run()
@@ -26,7 +26,66 @@ FORWARD_SIG = "forward_sig"
 REVERSE_SIG = "reverse_sig"
 FF_INTER = "ff_inter"
 FT_INTER = "ft_inter"
+FF_MODE = "ff_mode"
+PRECISION = "precision"
+BACKEND = "backend"
+ENGINE = "engine"
+SEED = "seed"
+UPDATE_SCHEME = "update_scheme"
+WORKERS = "workers"
+EARLY_STOPPING = "early_stopping"
+CONVERGENCE_WINDOW = "convergence_window"
+CONVERGENCE_TOLERANCE = "convergence_tolerance"
+SCHEDULER = "scheduler"
+SCHEDULER_WINDOW = "scheduler_window"
+SCHEDULER_MIN_RATE = "scheduler_min_rate"
+HISTORY_LEVEL = "history_level"
+HISTORY_INTERVAL = "history_interval"
+TRAJECTORY_ENCODING = "trajectory_encoding"
+HISTORY_GC_IDS = "history_gc_ids"
+HISTORY_DIRECTORY = "history_directory"
+HISTORY_CHUNK = "history_chunk"
 
+# Fiber-Fiber Interaction Modes
+FF_PAIRWISE = "pairwise"  # sum pairwise overlaps with neighbouring growth cones
+FF_MESH = "mesh"  # read overlaps from fiber density rasters, independent of local density
+
+# Precision Modes
+PRECISION_LEGACY = "legacy"  # quantize signals and potentials to 6 decimals, reproduces original trajectories
+PRECISION_FLOAT64 = "float64"  # no quantization
+PRECISION_FLOAT32 = "float32"  # quantize to single precision, compact state
+
+# Potential Computation Backends
+BACKEND_AUTO = "auto"  # pick by growth cone count and size, substrate size and installed packages
+BACKEND_REFERENCE = "reference"  # recompute everything from scratch, ground truth
+BACKEND_PYTHON = "python"
+BACKEND_NUMPY = "numpy"
+BACKEND_NUMBA = "numba"  # requires numba
+
+# Simulation Engines
+ENGINE_OBJECT = "object"  # step growth cone objects in Python
+ENGINE_ARRAY = "array"  # step struct-of-arrays state, vectorized across growth cones where possible
+ENGINE_COMPILED = "compiled"  # run steps in a compiled kernel, requires numba, falls back to object otherwise
+ENGINE_DECOMPOSED = "decomposed"  # split the substrate into WORKERS strips run by processes, requires numba
+
+# Update Schemes
+UPDATE_SEQUENTIAL = "sequential"  # growth cones see the moves of the ones before them in the same step (Gauss-Seidel)
+UPDATE_SYNCHRONOUS = "synchronous"  # all growth cones step against the same snapshot (Jacobi), requires array engine
+
+# Schedulers
+SCHEDULER_ALL = "all"  # visit every growth cone in every step
+SCHEDULER_MOVEMENT = "movement"  # visit growth cones by their share of recently accepted steps, object engine only
+SCHEDULER_VARIANCE = "variance"  # visit growth cones by the variance of their recent potentials, object engine only
+
+# History Recording Levels
+HISTORY_NONE = "none"  # keep only the initial values and the potentials needed for adaptation
+HISTORY_FINAL = "final"  # keep the initial and the latest entry of every series
+HISTORY_EVERY = "every"  # keep every HISTORY_INTERVAL-th entry of every series
+HISTORY_FULL = "full"  # keep every entry
+
+# Trajectory Encodings
+TRAJECTORY_PLAIN = "plain"  # store every recorded position as a pair of integers
+TRAJECTORY_MOVES = "moves"  # store the moves between positions as 4-bit codes, at HISTORY_FULL only
 
 # Adaptation
 ADAPTATION_ENABLED = "adaptation_enabled"
@@ -88,7 +147,26 @@ simulation_advanced = {
     FORWARD_SIG: True,
     REVERSE_SIG: True,
     FF_INTER: True,
-    FT_INTER: True
+    FT_INTER: True,
+    FF_MODE: FF_PAIRWISE,
+    PRECISION: PRECISION_LEGACY,
+    BACKEND: BACKEND_AUTO,
+    ENGINE: ENGINE_OBJECT,
+    SEED: None,  # None draws from the global random module
+    UPDATE_SCHEME: UPDATE_SEQUENTIAL,
+    WORKERS: 4,
+    EARLY_STOPPING: False,  # stop once the potential and movement of the growth cones have plateaued
+    CONVERGENCE_WINDOW: 500,  # steps per window of the plateau test
+    CONVERGENCE_TOLERANCE: 0.02,  # largest relative change between two windows
+    SCHEDULER: SCHEDULER_ALL,
+    SCHEDULER_WINDOW: 50,  # visits of a growth cone its activity is measured over
+    SCHEDULER_MIN_RATE: 0.1,  # smallest share of steps every growth cone is visited in
+    HISTORY_LEVEL: HISTORY_FULL,
+    HISTORY_INTERVAL: 10,  # entries per recorded entry at HISTORY_EVERY
+    TRAJECTORY_ENCODING: TRAJECTORY_PLAIN,
+    HISTORY_GC_IDS: None,  # ids of the growth cones recorded at HISTORY_LEVEL, the others at HISTORY_NONE; None for all
+    HISTORY_DIRECTORY: None,  # stream histories to memory-mapped files in a run directory below it, None for memory
+    HISTORY_CHUNK: 4096  # entries per chunk written to HISTORY_DIRECTORY
 }
 
 adaptation = {
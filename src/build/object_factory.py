@@ -5,8 +5,17 @@ Module for setting up all the objects in the model.
 import numpy as np
 
 from build import config as cfg
+from model.array_simulation import ArraySimulation
+from model.backends import select_backend
+from model.compiled import CompiledSimulation
+from model.convergence import ConvergenceMonitor
+from model.decomposed import DecomposedSimulation
 from model.growth_cone import GrowthCone
+from model.precision import get_precision_policy
+from model.replicas import ReplicaSimulation
+from model.scheduler import ActivityScheduler
 from model.simulation import Simulation
+from model.synchronous import SynchronousSimulation
 from model.substrate import (ContinuousGradientSubstrate, WedgeSubstrate,
                              StripeSubstrate, GapSubstrate, GapSubstrateInverted)
 
@@ -26,6 +35,83 @@ def build_simulation(config):
     substrate = build_substrate(config)
     growth_cones = initialize_growth_cones(config)
 
+    seed = config.get(cfg.SEED)
+    engine = config.get(cfg.ENGINE, cfg.ENGINE_OBJECT)
+    engine_options = {}
+    if engine == cfg.ENGINE_OBJECT:
+        simulation_class = Simulation
+    elif engine == cfg.ENGINE_ARRAY:
+        simulation_class = ArraySimulation
+    elif engine == cfg.ENGINE_COMPILED:
+        simulation_class = CompiledSimulation
+    elif engine == cfg.ENGINE_DECOMPOSED:
+        simulation_class = DecomposedSimulation
+        engine_options["workers"] = config.get(cfg.WORKERS, 4)
+    else:
+        raise ValueError("Engine unknown")
+    update_scheme = config.get(cfg.UPDATE_SCHEME, cfg.UPDATE_SEQUENTIAL)
+    if update_scheme == cfg.UPDATE_SYNCHRONOUS:
+        if engine != cfg.ENGINE_ARRAY:
+            raise ValueError("Synchronous updates require the array engine")
+        simulation_class = SynchronousSimulation
+    elif update_scheme != cfg.UPDATE_SEQUENTIAL:
+        raise ValueError("Update scheme unknown")
+
+    convergence = None
+    if config.get(cfg.EARLY_STOPPING, False):
+        convergence = ConvergenceMonitor(config.get(cfg.CONVERGENCE_WINDOW, 500),
+                                         config.get(cfg.CONVERGENCE_TOLERANCE, 0.02))
+
+    scheduler = None
+    scheduler_measure = config.get(cfg.SCHEDULER, cfg.SCHEDULER_ALL)
+    if scheduler_measure != cfg.SCHEDULER_ALL:
+        if simulation_class is not Simulation:
+            raise ValueError("Activity scheduling requires the object engine")
+        scheduler = ActivityScheduler(scheduler_measure, config.get(cfg.SCHEDULER_WINDOW, 50),
+                                      config.get(cfg.SCHEDULER_MIN_RATE, 0.1))
+
+    # Initialize the Simulation object with the new parameters
+    simulation = simulation_class(substrate, growth_cones, *build_parameters(config, substrate), seed,
+                                  convergence=convergence, scheduler=scheduler, **build_recording(config),
+                                  **engine_options)
+    simulation.run_config = dict(config)
+    return simulation
+
+
+def build_replicas(config, seeds):
+    """
+    Build a ReplicaSimulation running one replica of the configuration per seed, on a shared substrate.
+    """
+    substrate = build_substrate(config)
+    replicas = [initialize_growth_cones(config) for _ in seeds]
+    simulation = ReplicaSimulation(substrate, replicas, *build_parameters(config, substrate), seeds=seeds,
+                                   **build_recording(config))
+    simulation.run_config = dict(config)
+    return simulation
+
+
+def build_recording(config):
+    """
+    Extract the history recording options from the configuration, as keyword arguments of the Simulation
+    constructor.
+    """
+    return {"history_level": config.get(cfg.HISTORY_LEVEL, cfg.HISTORY_FULL),
+            "history_interval": config.get(cfg.HISTORY_INTERVAL, 10),
+            "trajectory_encoding": config.get(cfg.TRAJECTORY_ENCODING, cfg.TRAJECTORY_PLAIN),
+            "history_gc_ids": config.get(cfg.HISTORY_GC_IDS),
+            "history_directory": config.get(cfg.HISTORY_DIRECTORY),
+            "history_chunk": config.get(cfg.HISTORY_CHUNK, 4096)}
+
+
+def build_parameters(config, substrate):
+    """
+    Extract the simulation parameters from the configuration, in the order of the Simulation constructor following
+    the substrate and growth cones.
+    """
+    precision = get_precision_policy(config.get(cfg.PRECISION, cfg.PRECISION_LEGACY))
+    backend = select_backend(config.get(cfg.BACKEND, cfg.BACKEND_AUTO), config.get(cfg.GC_COUNT),
+                             config.get(cfg.GC_SIZE), substrate)
+
     # Extract attributes from the configuration
     step_size = config.get(cfg.STEP_SIZE)
     num_steps = config.get(cfg.STEP_NUM)
@@ -34,13 +120,15 @@ def build_simulation(config):
     y_step_p = config.get(cfg.Y_STEP_POSSIBILITY)
     sigmoid_steepness = config.get(cfg.SIGMOID_STEEPNESS)
     sigmoid_shift = config.get(cfg.SIGMOID_SHIFT)
-    sigmoid_height = config.get(cfg.SIGMOID_HEIGHT)
     sigma = config.get(cfg.SIGMA)
     force = config.get(cfg.FORCE)
     forward_sig = config.get(cfg.FORWARD_SIG)
     reverse_sig = config.get(cfg.REVERSE_SIG)
     ff_inter = config.get(cfg.FF_INTER)
     ft_inter = config.get(cfg.FT_INTER)
+    ff_mode = config.get(cfg.FF_MODE, cfg.FF_PAIRWISE)
+    if ff_mode not in (cfg.FF_PAIRWISE, cfg.FF_MESH):
+        raise ValueError("FF mode unknown")
 
     adaptation = config.get(cfg.ADAPTATION_ENABLED)
     mu = 0
@@ -52,11 +140,8 @@ def build_simulation(config):
         lambda_ = config.get(cfg.ADAPTATION_LAMBDA)
         history_length = config.get(cfg.ADAPTATION_HISTORY)
 
-    # Initialize the Simulation object with the new parameters
-    simulation = Simulation(substrate, growth_cones, adaptation, step_size, num_steps, x_step_p, y_step_p,
-                            sigmoid_steepness, sigmoid_shift, sigma, force, forward_sig, reverse_sig, ff_inter,
-                            ft_inter, mu, lambda_, history_length)
-    return simulation
+    return (adaptation, step_size, num_steps, x_step_p, y_step_p, sigmoid_steepness, sigmoid_shift, sigma, force,
+            forward_sig, reverse_sig, ff_inter, ft_inter, mu, lambda_, history_length, ff_mode, precision, backend)
 
 
 def build_substrate(config):
@@ -118,6 +203,7 @@ def initialize_growth_cones(config):
     gc_count = config.get(cfg.GC_COUNT)
     size = config.get(cfg.GC_SIZE)
     rows = config.get(cfg.ROWS)
+    precision = get_precision_policy(config.get(cfg.PRECISION, cfg.PRECISION_LEGACY))
 
     # Non-linear gradient for receptors, starting at 0.99 and decreasing to 0.01
     receptor_gradient = np.linspace(0, 1, gc_count) ** 1.4
@@ -127,13 +213,19 @@ def initialize_growth_cones(config):
     ligands = 0.01 + receptor_gradient * 2.99
     ligands = ligands[::-1]
 
+    # Initial values in the dtype of the precision policy, so the histories store them exactly. Legacy precision
+    # keeps them unquantized, like the original model
+    receptors = receptors.astype(precision.dtype).tolist()
+    ligands = ligands.astype(precision.dtype).tolist()
+
     # Create an array of evenly distributed y-positions for the growth cones
     y_positions = np.linspace(size, rows - 1 + size, gc_count, dtype=int)
 
     for i in range(gc_count):
         # Create a GrowthCone instance and initialize it
         pos_y = y_positions[i]
-        gc = GrowthCone((size, pos_y), size, ligands[i], receptors[i], i)
+        gc = GrowthCone((size, pos_y), size, ligands[i], receptors[i], i, quantize=precision.quantize,
+                        dtype=precision.dtype)
         growth_cones.append(gc)
 
     return growth_cones
@@ -0,0 +1,391 @@
+"""
+Module providing the ArraySimulation class, a simulation engine over struct-of-arrays growth cone state.
+"""
+
+import math
+import random
+
+import numpy as np
+
+from build import config
+from model import simulation
+from model.cell_list import IndexCellList
+from model.potential_calculation import (ff_coef_schedule, ft_interaction_direct, geometry_table, guidance_signals,
+                                         signal_potential)
+
+# Steps per block, random numbers are drawn ahead and histories are written back for one block at a time
+BLOCK_STEPS = 250
+
+# Growth cones from which the fiber-fiber sums read the neighbours from a cell index, below it scanning all of them
+# costs less than gathering the neighbours
+CELL_INDEX_GCS = 2000
+
+
+class ArraySimulation(simulation.Simulation):
+    """
+    Simulation engine that keeps the growth cone state in contiguous arrays during the iteration instead of stepping
+    GrowthCone objects. Per-run tables, the fiber-fiber coefficient of every step and the Gaussian constants of the
+    step decision, are computed once. Within a step, everything that only depends on a growth cone's own state,
+    i.e. adaptation, the random proposal and the fiber-target sums at the proposal, is computed for all growth cones
+    at once, the rest runs growth cone by growth cone in list order.
+
+    The growth cones are packed before the iteration and unpacked afterwards, with their full history, so results
+    are the same GrowthCone objects the Python iteration produces. Random numbers come from the same random streams,
+    or without a seed, from the random module in the same order, so seeded runs follow the same trajectories.
+
+    Attributes:
+        arrays (GrowthConeArrays): State of the growth cones during the iteration.
+        index_cells (IndexCellList): Neighbour index over the array positions for the fiber-fiber sums of large
+            runs, None if they scan all growth cones.
+        ff_coefs (np.ndarray): Fiber-fiber coefficient for every step.
+        density_denominator (float): Denominator of the exponent of probabilistic_density.
+        density_norm (float): Normalization of probabilistic_density.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.arrays = None
+        self.index_cells = None
+        self.ff_coefs = None
+        self.density_denominator = 2 * self.sigma ** 2
+        self.density_norm = math.sqrt(2 * math.pi) * self.sigma
+
+    def iterate_simulation(self):
+        if not self.array_supported():
+            super().iterate_simulation()
+            return
+
+        gcs = self.growth_cones
+        self.arrays = GrowthConeArrays(gcs, max(1, self.history_length), self.precision.dtype)
+        if self.ff_inter and len(gcs) >= CELL_INDEX_GCS:
+            self.index_cells = IndexCellList(self.arrays.xs, self.arrays.ys, int(self.arrays.sizes.max()))
+        self.ff_coefs = ff_coef_schedule(self.num_steps, self.sigmoid_steepness, self.sigmoid_shift)
+        active = np.flatnonzero(~self.arrays.frozen)
+        draws = 2 if self.force else 3
+        # Blocks end at every sample of the convergence monitor
+        block_steps = BLOCK_STEPS if self.convergence is None else self.convergence.sample_steps
+
+        for step_first in range(0, self.num_steps, block_steps):
+            steps = min(block_steps, self.num_steps - step_first)
+            if step_first % BLOCK_STEPS == 0:
+                print(f"Current Step: {step_first}")
+                simulation.progress = int((step_first / self.num_steps) * 100)
+
+            if self.random_streams is None:
+                uniforms = np.array([random.random() for _ in range(steps * len(active) * draws)], dtype=float)
+                uniforms = uniforms.reshape(steps, len(active), draws)
+            else:
+                uniforms = self.random_streams.uniforms(active, step_first, steps)
+            records = allocate_records(steps, len(gcs))
+            self.run_block(step_first, uniforms, active, records)
+            unpack_records(gcs, records, self.adaptation)
+            if self.converged(step_first + steps):
+                break
+
+        self.arrays.write_back(gcs)
+        self.build_ff_index()
+        simulation.progress = 100
+
+    def converged(self, steps_taken):
+        if self.arrays is None:
+            return super().converged(steps_taken)
+        if self.convergence is None or steps_taken % self.convergence.sample_steps:
+            return False
+        moving = np.flatnonzero(~self.arrays.frozen)
+        return self.record_convergence(steps_taken, self.arrays.xs[moving], self.arrays.ys[moving],
+                                       self.arrays.potentials[moving])
+
+    def array_supported(self):
+        """
+        Check whether the array engine covers the configuration of this simulation. Fiber density fields are only
+        maintained by the Python iteration.
+        """
+        return (bool(self.growth_cones)
+                and self.ff_mode == config.FF_PAIRWISE
+                and not (self.adaptation and self.history_length < 1))
+
+    def run_block(self, step_first, uniforms, active, records):
+        """
+        Run a block of steps, recording acceptance, positions and adapted values.
+
+        :param uniforms: Random numbers of the block, indexed by step, active growth cone and draw.
+        :param active: Indexes of the growth cones that are not frozen.
+        """
+        rec_accepted, rec_positions, rec_potentials = records[:3]
+        arrays = self.arrays
+        xs, ys = arrays.xs, arrays.ys
+        quantize = self.precision.quantize
+        areas = {size: np.array(geometry_table(size).area, dtype=float) for size in set(arrays.sizes[active])}
+
+        for step in range(uniforms.shape[0]):
+            ff_coef = self.ff_coefs[step_first + step] if self.ff_inter else 0
+            if self.adaptation:
+                ligands_new, receptors_new = self.adapt_block(active, records, step)
+            xs_new, ys_new = self.propose_block(uniforms[step], active)
+            ft_ligands, ft_receptors = self.ft_block(active, xs_new, ys_new)
+
+            for a, i in enumerate(active.tolist()):
+                if self.adaptation:
+                    arrays.ligands[i] = ligands_new[a]
+                    arrays.receptors[i] = receptors_new[a]
+                ligand = arrays.ligands[i]
+                receptor = arrays.receptors[i]
+                x, y = xs_new[a], ys_new[a]
+
+                ff_ligands = ff_receptors = 0
+                if self.ff_inter:
+                    ff_ligands, ff_receptors = self.ff_sums(i, x, y, areas[arrays.sizes[i]])
+
+                forward_sig, reverse_sig = guidance_signals(ligand, receptor, ft_ligands[a], ft_receptors[a],
+                                                            ff_ligands, ff_receptors, ff_coef, self.forward_sig,
+                                                            self.reverse_sig)
+                potential_new = signal_potential(forward_sig, reverse_sig, quantize)
+
+                if not self.force:
+                    old_density = self.density(arrays.potentials[i])
+                    new_density = self.density(potential_new)
+                    if old_density + new_density == 0:
+                        probability = 0.5
+                    else:
+                        probability = old_density / (old_density + new_density)
+                    if not uniforms[step, a, 2] > probability:
+                        continue
+
+                if self.index_cells is not None:
+                    self.index_cells.on_move(i, xs[i], ys[i], x, y)
+                xs[i], ys[i] = x, y
+                arrays.potentials[i] = potential_new
+                arrays.push_potential(i, potential_new)
+                rec_accepted[step, i] = True
+                rec_positions[step, i] = x, y
+                rec_potentials[step, i] = potential_new
+
+    def adapt_block(self, active, records, step):
+        """
+        Calculate the adaptation of all active growth cones, see GrowthCone.calculate_adaptation and
+        apply_adaptation. Coefficients and resetting forces are stored right away, the adapted ligand and receptor
+        values are returned, to be stored at each growth cone's turn, when the Python iteration would adapt it.
+        """
+        arrays = self.arrays
+        quantize = self.precision.quantize
+        h = self.history_length
+
+        ready = active[arrays.window_counts[active] >= h]
+        if len(ready):
+            window = arrays.window(ready, h)
+            weighted = np.cumsum(np.arange(1, h + 1) * np.abs(window), axis=1)[:, -1]
+            log_args = 1 + self.mu * weighted / sum(range(1, h + 1))
+            arrays.adap_cos[ready] = [quantize(1 + math.log(arg)) for arg in log_args.tolist()]
+            arrays.reset_receptors[ready] = self.lambda_ * (arrays.start_receptors[ready] - arrays.receptors[ready])
+            arrays.reset_ligands[ready] = self.lambda_ * (arrays.start_ligands[ready] - arrays.ligands[ready])
+
+        adap_cos = arrays.adap_cos[active]
+        ligands = np.maximum(0, arrays.ligands[active] * adap_cos + arrays.reset_ligands[active])
+        receptors = np.maximum(0, arrays.receptors[active] * adap_cos + arrays.reset_receptors[active])
+        ligands = [quantize(value) for value in ligands.tolist()]
+        receptors = [quantize(value) for value in receptors.tolist()]
+
+        _, _, _, rec_adap_cos, rec_ligands, rec_receptors, rec_reset_ligands, rec_reset_receptors = records
+        rec_adap_cos[step, active] = adap_cos
+        rec_ligands[step, active] = ligands
+        rec_receptors[step, active] = receptors
+        rec_reset_ligands[step, active] = arrays.reset_ligands[active]
+        rec_reset_receptors[step, active] = arrays.reset_receptors[active]
+        return ligands, receptors
+
+    def propose_block(self, uniforms, active):
+        """
+        Generate the random steps of all active growth cones from their uniforms, see gen_random_step.
+        """
+        x_prob = self.x_step_p
+        y_prob = self.y_step_p
+        xt_directions = choose_directions(uniforms[:, 0], (1 - x_prob), (1 - x_prob), x_prob)
+        yt_directions = choose_directions(uniforms[:, 1], y_prob, (1 - y_prob), y_prob)
+
+        sizes = self.arrays.sizes[active]
+        xs_new = self.arrays.xs[active] + xt_directions * self.step_size
+        ys_new = self.arrays.ys[active] + yt_directions * self.step_size
+        xs_new = np.maximum(sizes, np.minimum(xs_new, self.substrate.cols - 1 - sizes))
+        ys_new = np.maximum(sizes, np.minimum(ys_new, self.substrate.rows - 1 - sizes))
+        return xs_new.tolist(), ys_new.tolist()
+
+    def ft_block(self, active, xs_new, ys_new):
+        """
+        Calculate the fiber-target sums of all active growth cones at their proposals, see ft_interaction.
+        """
+        if not self.ft_inter:
+            return [0] * len(active), [0] * len(active)
+
+        xs_new = np.array(xs_new, dtype=np.int64)
+        ys_new = np.array(ys_new, dtype=np.int64)
+        sizes = self.arrays.sizes[active]
+        sum_ligands = np.zeros(len(active))
+        sum_receptors = np.zeros(len(active))
+
+        for size in set(sizes.tolist()):
+            covered = ((sizes == size) & (xs_new >= size) & (xs_new < self.substrate.cols - size)
+                       & (ys_new >= size) & (ys_new < self.substrate.rows - size))
+            ligand_field, receptor_field = self.substrate.get_footprint_fields(size)
+            sum_ligands[covered] = ligand_field[ys_new[covered], xs_new[covered]]
+            sum_receptors[covered] = receptor_field[ys_new[covered], xs_new[covered]]
+
+            for a in np.flatnonzero((sizes == size) & ~covered):
+                gc = self.growth_cones[active[a]]
+                sum_ligands[a], sum_receptors[a] = ft_interaction_direct(gc, (xs_new[a], ys_new[a]), self.substrate)
+
+        return sum_ligands.tolist(), sum_receptors.tolist()
+
+    def ff_sums(self, i, x, y, areas):
+        """
+        Calculate the fiber-fiber sums of growth cone i at a position, see ff_interaction. Scans all growth cones,
+        or with a cell index only the ones in the cells around the position.
+        """
+        arrays = self.arrays
+        if self.index_cells is None:
+            dx = arrays.xs - x
+            dy = arrays.ys - y
+            d_squared = dx * dx + dy * dy
+            near = np.nonzero(d_squared < len(areas))[0]
+            near = near[near != i]
+            area = areas[d_squared[near]]
+        else:
+            near = self.index_cells.neighbours(x, y)
+            dx = arrays.xs[near] - x
+            dy = arrays.ys[near] - y
+            d_squared = dx * dx + dy * dy
+            keep = (d_squared < len(areas)) & (near != i)
+            near = near[keep]
+            area = areas[d_squared[keep]]
+
+        # Python's sum adds in list order, exactly like ff_interaction
+        return sum((area * arrays.ligands[near]).tolist()), sum((area * arrays.receptors[near]).tolist())
+
+    def density(self, potential):
+        """
+        Compute probabilistic_density with the per-run Gaussian constants.
+        """
+        return math.exp(-potential ** 2 / self.density_denominator) / self.density_norm
+
+
+class GrowthConeArrays:
+    """
+    Struct-of-arrays copy of the growth cone state, indexed like the simulation's growth cone list.
+
+    Attributes:
+        xs, ys (np.ndarray): Positions.
+        sizes (np.ndarray): Radii.
+        ligands, receptors (np.ndarray): Current signal values.
+        potentials (np.ndarray): Current potentials.
+        adap_cos (np.ndarray): Adaptation coefficients.
+        reset_ligands, reset_receptors (np.ndarray): Resetting forces.
+        start_ligands, start_receptors (np.ndarray): Initial signal values.
+        frozen (np.ndarray): Freeze flags.
+        windows (np.ndarray): Ring buffers of the last potentials of every growth cone, for adaptation, in the dtype
+            of the precision policy. The other values stay in double precision, which the engines compute in.
+        window_counts (np.ndarray): Number of potentials pushed so far, including the ones from before packing.
+    """
+
+    def __init__(self, gcs, window_length, dtype=float):
+        """
+        Copy the state of growth cones into arrays, including the tail of their potential history.
+
+        :param window_length: Number of potentials kept per growth cone.
+        :param dtype: Dtype of the potential windows, taken from the precision policy.
+        """
+        self.xs = np.array([gc.pos[0] for gc in gcs], dtype=np.int64)
+        self.ys = np.array([gc.pos[1] for gc in gcs], dtype=np.int64)
+        self.sizes = np.array([gc.size for gc in gcs], dtype=np.int64)
+        self.ligands = np.array([gc.ligand_current for gc in gcs], dtype=float)
+        self.receptors = np.array([gc.receptor_current for gc in gcs], dtype=float)
+        self.potentials = np.array([gc.potential for gc in gcs], dtype=float)
+        self.adap_cos = np.array([gc.adap_co for gc in gcs], dtype=float)
+        self.reset_ligands = np.array([gc.reset_force_ligand for gc in gcs], dtype=float)
+        self.reset_receptors = np.array([gc.reset_force_receptor for gc in gcs], dtype=float)
+        self.start_ligands = np.array([gc.get_start_ligand() for gc in gcs], dtype=float)
+        self.start_receptors = np.array([gc.get_start_receptor() for gc in gcs], dtype=float)
+        self.frozen = np.array([bool(gc.freeze) for gc in gcs], dtype=np.bool_)
+
+        # The oldest entry of a full ring buffer sits at window_count % window_length
+        self.windows = np.zeros((len(gcs), window_length), dtype=dtype)
+        self.window_counts = np.array([gc.history.count("potential") for gc in gcs], dtype=np.int64)
+        for i, gc in enumerate(gcs):
+            tail = gc.history.latest("potential", window_length)
+            for k, potential in enumerate(tail, gc.history.count("potential") - len(tail)):
+                self.windows[i, k % window_length] = potential
+
+    def push_potential(self, i, potential):
+        """
+        Append a potential to the window of growth cone i.
+        """
+        self.windows[i, self.window_counts[i] % self.windows.shape[1]] = potential
+        self.window_counts[i] += 1
+
+    def window(self, indexes, h):
+        """
+        Return the last h potentials of the growth cones at indexes, oldest first.
+        """
+        slots = (self.window_counts[indexes, np.newaxis] - h + np.arange(h)) % self.windows.shape[1]
+        return self.windows[indexes[:, np.newaxis], slots]
+
+    def kernel_state(self):
+        """
+        Return the arrays in the order the compiled kernel takes them.
+        """
+        return (self.xs, self.ys, self.ligands, self.receptors, self.potentials, self.adap_cos, self.reset_ligands,
+                self.reset_receptors, self.start_ligands, self.start_receptors, self.windows, self.window_counts)
+
+    def write_back(self, gcs):
+        """
+        Copy the array state back onto the growth cones.
+        """
+        for i, gc in enumerate(gcs):
+            if not gc.freeze:
+                gc.pos = int(self.xs[i]), int(self.ys[i])
+                gc.ligand_current = float(self.ligands[i])
+                gc.receptor_current = float(self.receptors[i])
+                gc.potential = float(self.potentials[i])
+                gc.adap_co = float(self.adap_cos[i])
+                gc.reset_force_ligand = float(self.reset_ligands[i])
+                gc.reset_force_receptor = float(self.reset_receptors[i])
+
+
+def choose_directions(uniforms, weight_low, weight_mid, weight_high):
+    """
+    Map uniform numbers onto -1, 0 or +1 like random.choices with these weights does.
+    """
+    cum_low = weight_low
+    cum_mid = cum_low + weight_mid
+    total = cum_mid + weight_high + 0.0
+    values = uniforms * total
+    return np.where(values < cum_low, -1, np.where(values < cum_mid, 0, 1))
+
+
+def allocate_records(steps, count):
+    """
+    Allocate the per step records of a block: acceptance, position and potential after the step, and the adapted
+    values.
+    """
+    accepted = np.zeros((steps, count), dtype=np.bool_)
+    positions = np.zeros((steps, count, 2), dtype=np.int64)
+    floats = tuple(np.zeros((steps, count), dtype=float) for _ in range(6))
+    return (accepted, positions) + floats
+
+
+def unpack_records(gcs, records, adaptation):
+    """
+    Append the records of a block to the growth cone histories, as the Python iteration would have.
+    """
+    accepted, positions, potentials, adap_cos, ligands, receptors, reset_ligands, reset_receptors = records
+    for i, gc in enumerate(gcs):
+        if gc.freeze:
+            continue
+        history = gc.history
+        steps = np.flatnonzero(accepted[:, i])
+        history.extend("position", positions[steps, i])
+        history.extend("potential", potentials[steps, i])
+        if adaptation:
+            history.extend("adap_co", adap_cos[:, i])
+            history.extend("ligand", ligands[:, i])
+            history.extend("receptor", receptors[:, i])
+            history.extend("reset_force_ligand", reset_ligands[:, i])
+            history.extend("reset_force_receptor", reset_receptors[:, i])
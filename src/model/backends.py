@@ -0,0 +1,217 @@
+"""
+Module providing the registry of potential computation backends. The reference backend recomputes everything from
+scratch and serves as ground truth; the other backends must produce the same numbers, see check_conformance.
+"""
+
+import math
+
+import numpy as np
+
+from build import config
+from model.neighbour_sums import NeighbourSums
+from model.potential_calculation import (calculate_potential, calculate_ff_coef, potential_from_sums, ft_interaction,
+                                         ft_interaction_direct, ff_interaction, ff_interaction_direct,
+                                         ff_interaction_batch, geometry_table)
+from model.precision import quantize_legacy
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Expected growth cones per neighbour query from which compiled fiber-fiber sums pay off
+DENSE_NEIGHBOURHOOD = 48
+
+
+class Backend:
+    """
+    Base class of potential computation backends. Subclasses provide the fiber-target and fiber-fiber sums.
+    """
+    name = None
+
+    def ft_interaction(self, gc, pos, substrate):
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def ff_interaction(self, gc, pos, gcs, ff_source=None):
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def calculate_potential(self, gc, pos, gcs, substrate, forward_on, reverse_on, ff_inter_on, ft_inter_on,
+                            step, num_steps, sigmoid_steepness, sigmoid_shift, ff_source=None,
+                            quantize=quantize_legacy):
+        """
+        Calculate guidance potential for a growth cone, see potential_calculation.calculate_potential.
+        """
+        ft_ligands, ft_receptors = (0, 0)
+        ff_ligands, ff_receptors = (0, 0)
+        ff_coef = 0
+
+        if ft_inter_on:
+            ft_ligands, ft_receptors = self.ft_interaction(gc, pos, substrate)
+        if ff_inter_on:
+            ff_coef = calculate_ff_coef(step, num_steps, sigmoid_steepness, sigmoid_shift)
+            ff_ligands, ff_receptors = self.ff_interaction(gc, pos, gcs, ff_source)
+
+        return potential_from_sums(gc, ft_ligands, ft_receptors, ff_ligands, ff_receptors, ff_coef, forward_on,
+                                   reverse_on, quantize)
+
+
+class ReferenceBackend(Backend):
+    """
+    Walks every footprint cell and every growth cone pair, computing all geometry from scratch. Ignores caches and
+    density fields, so it always scans the full gcs list.
+    """
+    name = config.BACKEND_REFERENCE
+
+    def ft_interaction(self, gc, pos, substrate):
+        return ft_interaction_direct(gc, pos, substrate)
+
+    def ff_interaction(self, gc, pos, gcs, ff_source=None):
+        return ff_interaction_direct(gc, pos, gcs)
+
+
+class PythonBackend(Backend):
+    """
+    Pure Python with footprint fields, geometry tables and the neighbour caches of the simulation.
+    """
+    name = config.BACKEND_PYTHON
+
+    def ft_interaction(self, gc, pos, substrate):
+        return ft_interaction(gc, pos, substrate)
+
+    def ff_interaction(self, gc, pos, gcs, ff_source=None):
+        if ff_source is not None:
+            return ff_source.ff_sums(gc, pos)
+        return ff_interaction(gc, pos, gcs)
+
+    def calculate_potential(self, *args, **kwargs):
+        return calculate_potential(*args, **kwargs)
+
+
+class NumpyBackend(PythonBackend):
+    """
+    Vectorizes the fiber-fiber sums over the neighbours with NumPy. Gathering the neighbour state into arrays costs
+    more than the vectorized sum saves for a single position, so auto selection does not pick it.
+    """
+    name = config.BACKEND_NUMPY
+
+    def ff_interaction(self, gc, pos, gcs, ff_source=None):
+        starts = (0, 0)
+        if isinstance(ff_source, NeighbourSums):
+            gcs = ff_source.cell_list.neighbours(pos)
+            starts = ff_source.static_sums(pos)
+        elif ff_source is not None:
+            return ff_source.ff_sums(gc, pos)
+
+        sum_ligands, sum_receptors = ff_interaction_batch(gc, np.array([pos], dtype=np.int64), gcs, *starts)
+        return sum_ligands[0], sum_receptors[0]
+
+
+class NumbaBackend(NumpyBackend):
+    """
+    Sums the fiber-fiber interaction in a compiled loop. Only registered if Numba is installed.
+    """
+    name = config.BACKEND_NUMBA
+
+    def ff_interaction(self, gc, pos, gcs, ff_source=None):
+        starts = (0, 0)
+        if isinstance(ff_source, NeighbourSums):
+            gcs = ff_source.cell_list.neighbours(pos)
+            starts = ff_source.static_sums(pos)
+        elif ff_source is not None:
+            return ff_source.ff_sums(gc, pos)
+
+        skip = next((k for k, other in enumerate(gcs) if other == gc), -1)
+        xs = np.fromiter((other.pos[0] for other in gcs), dtype=np.int64, count=len(gcs))
+        ys = np.fromiter((other.pos[1] for other in gcs), dtype=np.int64, count=len(gcs))
+        ligands = np.fromiter((other.ligand_current for other in gcs), dtype=float, count=len(gcs))
+        receptors = np.fromiter((other.receptor_current for other in gcs), dtype=float, count=len(gcs))
+        areas = np.array(geometry_table(gc.size).area, dtype=float)
+        return ff_sums_kernel(pos[0], pos[1], xs, ys, ligands, receptors, areas, skip, float(starts[0]),
+                              float(starts[1]))
+
+
+def ff_sums_kernel(x, y, xs, ys, ligands, receptors, areas, skip, sum_ligands, sum_receptors):
+    """
+    Sum the fiber-fiber interaction at (x, y) over array-backed growth cones, skipping index skip, onto the given
+    sums. Adds the contributions in array order, like ff_interaction.
+    """
+    in_range = areas.shape[0]
+    for k in range(xs.shape[0]):
+        if k == skip:
+            continue
+        dx = xs[k] - x
+        dy = ys[k] - y
+        d_squared = dx * dx + dy * dy
+        if d_squared < in_range:
+            area = areas[d_squared]
+            sum_ligands += area * ligands[k]
+            sum_receptors += area * receptors[k]
+    return sum_ligands, sum_receptors
+
+
+BACKENDS = {backend.name: backend for backend in (ReferenceBackend(), PythonBackend(), NumpyBackend())}
+
+if numba is not None:
+    ff_sums_kernel = numba.njit(cache=True)(ff_sums_kernel)
+    BACKENDS[config.BACKEND_NUMBA] = NumbaBackend()
+
+
+def get_backend(name):
+    """
+    Return a registered backend by name.
+    """
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError("Backend unknown or unavailable")
+    return backend
+
+
+def select_backend(name, gc_count, gc_size, substrate):
+    """
+    Return the configured backend. For auto, pick by the expected number of growth cones per neighbour query,
+    estimated from GC_COUNT, GC_SIZE and the substrate size, and by which optional packages are installed.
+    """
+    if name != config.BACKEND_AUTO:
+        return get_backend(name)
+
+    block_area = (3 * max(1, 2 * gc_size)) ** 2
+    expected_neighbours = gc_count * min(1.0, block_area / (substrate.rows * substrate.cols))
+    if expected_neighbours >= DENSE_NEIGHBOURHOOD and config.BACKEND_NUMBA in BACKENDS:
+        return get_backend(config.BACKEND_NUMBA)
+    return get_backend(config.BACKEND_PYTHON)
+
+
+def check_conformance(backend, substrate, growth_cones, step=0, num_steps=1, sigmoid_steepness=4, sigmoid_shift=3,
+                      rel_tol=0.0):
+    """
+    Compare a backend against the reference backend for every growth cone at its position and all positions one
+    step away that lie on the substrate, including positions whose footprint is cut off by the border.
+
+    :param rel_tol: Relative tolerance of the comparison, backends are expected to match exactly by default.
+    :return: List of (growth cone, position, quantity, expected, actual) mismatches, empty if the backend conforms.
+    """
+    reference = get_backend(config.BACKEND_REFERENCE)
+    mismatches = []
+
+    def compare(gc, pos, quantity, expected, actual):
+        for e, a in zip(np.atleast_1d(expected), np.atleast_1d(actual)):
+            if not math.isclose(e, a, rel_tol=rel_tol, abs_tol=0.0):
+                mismatches.append((gc, pos, quantity, expected, actual))
+                return
+
+    for gc in growth_cones:
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                pos = (gc.pos[0] + dx, gc.pos[1] + dy)
+                if not (0 <= pos[0] < substrate.cols and 0 <= pos[1] < substrate.rows):
+                    continue
+                compare(gc, pos, "ft_interaction", reference.ft_interaction(gc, pos, substrate),
+                        backend.ft_interaction(gc, pos, substrate))
+                compare(gc, pos, "ff_interaction", reference.ff_interaction(gc, pos, growth_cones),
+                        backend.ff_interaction(gc, pos, growth_cones))
+                args = (gc, pos, growth_cones, substrate, True, True, True, True, step, num_steps,
+                        sigmoid_steepness, sigmoid_shift)
+                compare(gc, pos, "calculate_potential", reference.calculate_potential(*args),
+                        backend.calculate_potential(*args))
+
+    return mismatches
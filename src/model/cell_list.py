@@ -0,0 +1,171 @@
+"""
+Module providing the CellList class, a uniform-grid neighbour index for fiber-fiber interaction.
+"""
+
+import numpy as np
+
+
+class CellList:
+    """
+    Buckets growth cones into square cells with an edge length of twice the growth cone size, so that every growth
+    cone within fiber-fiber interaction range of a position lies in the 3x3 block of cells around it.
+
+    Attributes:
+        cell_size (int): Edge length of a cell.
+        cells (dict): Maps cell coordinates to the growth cones inside, keyed by their rank.
+        ranks (dict): Maps each growth cone to its index in the simulation's growth cone list.
+        blocks (dict): Cached neighbour lists, keyed by center cell and span. Dropped when a growth cone enters or
+            leaves one of their cells.
+    """
+
+    def __init__(self, growth_cones, gc_size):
+        """
+        Initializes the CellList with all growth cones at their current positions.
+
+        :param growth_cones: Growth cones of the simulation, in iteration order.
+        :param gc_size: Largest growth cone radius of the simulation.
+        """
+        self.cell_size = max(1, 2 * gc_size)
+        self.cells = {}
+        self.ranks = {}
+        self.blocks = {}
+        self.spans = set()
+
+        for rank, gc in enumerate(growth_cones):
+            self.ranks[gc] = rank
+            self.cells.setdefault(self.cell_of(gc.pos), {})[rank] = gc
+
+    def cell_of(self, pos):
+        """
+        Return the coordinates of the cell containing a position.
+        """
+        return pos[0] // self.cell_size, pos[1] // self.cell_size
+
+    def neighbours(self, pos, reach=0):
+        """
+        Return all growth cones in the 3x3 block of cells around a position. They are ordered like the simulation's
+        growth cone list, so sums over them match a scan over the full list. The returned list is cached and
+        shared, it must not be modified.
+
+        :param reach: Extra distance to cover, e.g. the step size to serve all candidate moves from one query.
+        """
+        cx, cy = self.cell_of(pos)
+        span = 1 + -(-reach // self.cell_size)
+        block = self.blocks.get((cx, cy, span))
+        if block is not None:
+            return block
+
+        found = []
+        for i in range(cx - span, cx + span + 1):
+            for j in range(cy - span, cy + span + 1):
+                cell = self.cells.get((i, j))
+                if cell:
+                    found.extend(cell.items())
+        found.sort(key=lambda item: item[0])
+        block = self.blocks[cx, cy, span] = [gc for _, gc in found]
+        self.spans.add(span)
+        return block
+
+    def on_move(self, gc, pos_old):
+        """
+        Move a growth cone to the cell of its new position.
+        """
+        cell_old = self.cell_of(pos_old)
+        cell_new = self.cell_of(gc.pos)
+        if cell_old == cell_new:
+            return
+        rank = self.ranks[gc]
+        del self.cells[cell_old][rank]
+        self.cells.setdefault(cell_new, {})[rank] = gc
+        self.drop_blocks(cell_old)
+        self.drop_blocks(cell_new)
+
+    def on_adapt(self, gc, ligand_old, receptor_old):
+        """
+        Adaptation does not change positions, nothing to update.
+        """
+
+    def drop_blocks(self, cell):
+        """
+        Drop all cached neighbour lists whose block contains a cell.
+        """
+        cx, cy = cell
+        for span in self.spans:
+            for i in range(cx - span, cx + span + 1):
+                for j in range(cy - span, cy + span + 1):
+                    self.blocks.pop((i, j, span), None)
+
+
+class IndexCellList:
+    """
+    Counterpart of CellList for the array engines, which keep positions in arrays instead of growth cone objects.
+    Buckets growth cone indexes into the same cells, as sorted index arrays, and returns the 3x3 block around a
+    position as one sorted index array.
+
+    Attributes:
+        cell_size (int): Edge length of a cell.
+        cells (dict): Maps cell coordinates to the sorted array of indexes inside.
+        blocks (dict): Cached index arrays of 3x3 blocks, keyed by center cell. Dropped when an index enters or
+            leaves one of their cells.
+    """
+
+    def __init__(self, xs, ys, gc_size):
+        """
+        Initializes the IndexCellList with the growth cones at their current positions.
+
+        :param xs, ys: Positions, indexed like the simulation's growth cone list.
+        :param gc_size: Largest growth cone radius of the simulation.
+        """
+        self.cell_size = max(1, 2 * gc_size)
+        self.blocks = {}
+
+        cells = {}
+        for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            cells.setdefault(self.cell_of(x, y), []).append(i)
+        self.cells = {cell: np.array(indexes, dtype=np.int64) for cell, indexes in cells.items()}
+
+    def cell_of(self, x, y):
+        """
+        Return the coordinates of the cell containing a position.
+        """
+        return x // self.cell_size, y // self.cell_size
+
+    def neighbours(self, x, y):
+        """
+        Return the indexes of all growth cones in the 3x3 block of cells around a position, in ascending order, so
+        sums over them match a scan over the full arrays. The returned array is cached and shared, it must not be
+        modified.
+        """
+        cx, cy = self.cell_of(x, y)
+        block = self.blocks.get((cx, cy))
+        if block is not None:
+            return block
+
+        cells = self.cells
+        found = [cells[i, j] for i in range(cx - 1, cx + 2) for j in range(cy - 1, cy + 2) if (i, j) in cells]
+        block = self.blocks[cx, cy] = np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+        return block
+
+    def on_move(self, index, x_old, y_old, x_new, y_new):
+        """
+        Move an index to the cell of its new position.
+        """
+        cell_old = self.cell_of(x_old, y_old)
+        cell_new = self.cell_of(x_new, y_new)
+        if cell_old == cell_new:
+            return
+        indexes = self.cells[cell_old]
+        self.cells[cell_old] = np.delete(indexes, np.searchsorted(indexes, index))
+        indexes = self.cells.get(cell_new, np.empty(0, dtype=np.int64))
+        self.cells[cell_new] = np.insert(indexes, np.searchsorted(indexes, index), index)
+        self.drop_blocks(cell_old)
+        self.drop_blocks(cell_new)
+
+    def drop_blocks(self, cell):
+        """
+        Drop all cached index arrays whose block contains a cell.
+        """
+        cx, cy = cell
+        for i in range(cx - 1, cx + 2):
+            for j in range(cy - 1, cy + 2):
+                self.blocks.pop((i, j), None)
@@ -0,0 +1,253 @@
+"""
+Module providing the CompiledSimulation class, which runs whole simulation steps in a single compiled kernel over
+the array state of an ArraySimulation. Requires numba, without it the simulation falls back to the Python iteration.
+"""
+
+import math
+
+import numpy as np
+
+from build import config
+from model import simulation
+from model.array_simulation import ArraySimulation
+from model.backends import ff_sums_kernel
+from model.potential_calculation import geometry_table, guidance_signals
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Quantization modes of the kernel, by precision policy
+QUANTIZE_MODES = {config.PRECISION_LEGACY: 0, config.PRECISION_FLOAT64: 1, config.PRECISION_FLOAT32: 2}
+
+
+def jit(function):
+    """
+    Compile a function in nopython mode if Numba is installed, otherwise leave it interpreted.
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+class CompiledSimulation(ArraySimulation):
+    """
+    Array simulation whose blocks of steps run in a single compiled kernel. The kernel covers pairwise fiber-fiber
+    interaction of growth cones of one size. Other setups, and runs without Numba, use the Python iteration.
+    """
+
+    def iterate_simulation(self):
+        if numba is not None and self.compiled_supported():
+            super().iterate_simulation()
+        else:
+            simulation.Simulation.iterate_simulation(self)
+
+    def compiled_supported(self):
+        """
+        Check whether the kernel covers the configuration of this simulation.
+        """
+        return (self.array_supported()
+                and self.precision.name in QUANTIZE_MODES
+                and len({gc.size for gc in self.growth_cones}) == 1)
+
+    def run_block(self, step_first, uniforms, active, records):
+        areas, grids, params = self.kernel_tables()
+        ff_coefs = self.ff_coefs[step_first:step_first + uniforms.shape[0]]
+
+        run_block(ff_coefs, uniforms, active, *self.arrays.kernel_state(), *records, areas, *grids, *params)
+
+    def kernel_tables(self):
+        """
+        Return the per-run inputs of the kernel: the overlap areas, the footprint fields and substrate grids, and
+        the scalar parameters.
+        """
+        size = self.growth_cones[0].size
+        areas = np.array(geometry_table(size).area, dtype=float)
+        ligand_field, receptor_field = self.substrate.get_footprint_fields(size)
+        grids = (np.ascontiguousarray(ligand_field, dtype=float), np.ascontiguousarray(receptor_field, dtype=float),
+                 np.ascontiguousarray(self.substrate.ligands, dtype=float),
+                 np.ascontiguousarray(self.substrate.receptors, dtype=float))
+        params = (bool(self.adaptation), float(self.mu), float(self.lambda_), int(self.history_length),
+                  int(self.step_size), float(self.x_step_p), float(self.y_step_p), self.substrate.rows,
+                  self.substrate.cols, size, float(self.sigma), bool(self.force), bool(self.forward_sig),
+                  bool(self.reverse_sig), bool(self.ff_inter), bool(self.ft_inter), QUANTIZE_MODES[self.precision.name])
+        return areas, grids, params
+
+
+@jit
+def quantize(value, mode):
+    """
+    Kernel counterpart of the precision policies.
+    """
+    if mode == 0:
+        return round_6(float(value))
+    if mode == 2:
+        return float(np.float32(value))
+    return value
+
+
+@jit
+def round_6(value):
+    """
+    Round to 6 decimals correctly, like Python's round(value, 6). Numba's round scales by 10 ** 6 in floating point,
+    which misplaces values next to a rounding tie.
+
+    The product value * 10 ** 6 is split exactly into product + error (Dekker), which decides on which side of the
+    tie the exact value lies. Doubles of magnitude 2 ** 33 and above lie closer to themselves than to any other
+    double within half a millionth, so they round to themselves.
+    """
+    if not abs(value) < 2.0 ** 33:
+        return value
+    scale = 1e6
+    product = value * scale
+    split = 134217729.0 * value  # 2 ** 27 + 1
+    high = split - (split - value)
+    low = value - high
+    split = 134217729.0 * scale
+    scale_high = split - (split - scale)
+    scale_low = scale - scale_high
+    error = ((high * scale_high - product) + high * scale_low + low * scale_high) + low * scale_low
+
+    integer = math.floor(product)
+    above_tie = (product - integer - 0.5) + error
+    if above_tie > 0 or (above_tie == 0 and integer % 2 == 1):
+        integer += 1
+    return math.copysign(integer / scale, value)
+
+
+@jit
+def choose_direction(uniform, weight_low, weight_mid, weight_high):
+    """
+    Map a uniform number onto -1, 0 or +1 like random.choices with these weights does.
+    """
+    cum_low = weight_low
+    cum_mid = cum_low + weight_mid
+    total = cum_mid + weight_high
+    value = uniform * total
+    if value < cum_low:
+        return -1
+    if value < cum_mid:
+        return 0
+    return 1
+
+
+@jit
+def ft_sums(x, y, size, rows, cols, ligand_field, receptor_field, ligand_grid, receptor_grid):
+    """
+    Fiber-target sums at a position, from the footprint fields or by walking the cut off footprint at the border.
+    """
+    if size <= x < cols - size and size <= y < rows - size:
+        return ligand_field[y, x], receptor_field[y, x]
+
+    x_min = max(0, x - size)
+    x_max = min(cols - 1, x + size)
+    y_min = max(0, y - size)
+    y_max = min(rows - 1, y + size)
+    radius = abs(y_min - y_max) / 2
+    center_i = (y_min + y_max) / 2
+    center_j = (x_min + x_max) / 2
+
+    sum_ligands = 0.0
+    sum_receptors = 0.0
+    for i in range(y_min, y_max):
+        for j in range(x_min, x_max):
+            if math.sqrt((i - center_i) ** 2 + (j - center_j) ** 2) > radius:
+                continue
+            sum_ligands += ligand_grid[i, j]
+            sum_receptors += receptor_grid[i, j]
+    return sum_ligands, sum_receptors
+
+
+signals_kernel = jit(guidance_signals)
+
+
+@jit
+def density(potential, sigma):
+    """
+    Kernel counterpart of probabilistic_density.
+    """
+    return math.exp(-potential ** 2 / (2 * sigma ** 2)) / (math.sqrt(2 * math.pi) * sigma)
+
+
+@jit
+def run_block(ff_coefs, uniforms, active,
+              xs, ys, ligands, receptors, potentials, adap_cos, reset_ligands, reset_receptors, start_ligands,
+              start_receptors, windows, window_counts,
+              rec_accepted, rec_positions, rec_potentials, rec_adap_cos, rec_ligands, rec_receptors,
+              rec_reset_ligands, rec_reset_receptors,
+              areas, ligand_field, receptor_field, ligand_grid, receptor_grid,
+              adaptation, mu, lambda_, h, step_size, x_prob, y_prob, rows, cols, size, sigma, force, forward_on,
+              reverse_on, ff_on, ft_on, quantize_mode):
+    """
+    Run a block of simulation steps: adaptation, random proposal, potential and step decision for every active
+    growth cone in list order, exactly like Simulation.iterate_simulation.
+    """
+    window_length = windows.shape[1]
+    weight_norm = h * (h + 1) // 2
+
+    for step in range(ff_coefs.shape[0]):
+        ff_coef = ff_coefs[step]
+        for a in range(active.shape[0]):
+            i = active[a]
+
+            if adaptation:
+                count = window_counts[i]
+                if count >= h:
+                    weighted = 0.0
+                    for k in range(h):
+                        weighted += (k + 1) * abs(windows[i, (count - h + k) % window_length])
+                    adap_cos[i] = quantize(1 + math.log(1 + mu * weighted / weight_norm), quantize_mode)
+                    reset_receptors[i] = lambda_ * (start_receptors[i] - receptors[i])
+                    reset_ligands[i] = lambda_ * (start_ligands[i] - ligands[i])
+                ligands[i] = quantize(max(0.0, ligands[i] * adap_cos[i] + reset_ligands[i]), quantize_mode)
+                receptors[i] = quantize(max(0.0, receptors[i] * adap_cos[i] + reset_receptors[i]), quantize_mode)
+                rec_adap_cos[step, i] = adap_cos[i]
+                rec_reset_ligands[step, i] = reset_ligands[i]
+                rec_reset_receptors[step, i] = reset_receptors[i]
+                rec_ligands[step, i] = ligands[i]
+                rec_receptors[step, i] = receptors[i]
+
+            x_direction = choose_direction(uniforms[step, a, 0], 1 - x_prob, 1 - x_prob, x_prob)
+            y_direction = choose_direction(uniforms[step, a, 1], y_prob, 1 - y_prob, y_prob)
+            x_new = max(size, min(xs[i] + x_direction * step_size, cols - 1 - size))
+            y_new = max(size, min(ys[i] + y_direction * step_size, rows - 1 - size))
+
+            ft_ligands = ft_receptors = 0.0
+            ff_ligands = ff_receptors = 0.0
+            coef = 0.0
+            if ft_on:
+                ft_ligands, ft_receptors = ft_sums(x_new, y_new, size, rows, cols, ligand_field, receptor_field,
+                                                   ligand_grid, receptor_grid)
+            if ff_on:
+                coef = ff_coef
+                ff_ligands, ff_receptors = ff_sums_kernel(x_new, y_new, xs, ys, ligands, receptors, areas, i, 0.0, 0.0)
+
+            forward_sig, reverse_sig = signals_kernel(ligands[i], receptors[i], ft_ligands, ft_receptors, ff_ligands,
+                                                      ff_receptors, coef, forward_on, reverse_on, 0.0)
+            forward_sig = quantize(forward_sig, quantize_mode)
+            reverse_sig = quantize(reverse_sig, quantize_mode)
+            potential_new = 0.0
+            if forward_sig != 0 or reverse_sig != 0:
+                potential_new = abs(math.log(reverse_sig if reverse_sig != 0 else 0.0001)
+                                    - math.log(forward_sig if forward_sig != 0 else 0.0001))
+
+            take = force
+            if not force:
+                old_density = density(potentials[i], sigma)
+                new_density = density(potential_new, sigma)
+                probability = 0.5
+                if old_density + new_density != 0:
+                    probability = old_density / (old_density + new_density)
+                take = uniforms[step, a, 2] > probability
+
+            if take:
+                xs[i] = x_new
+                ys[i] = y_new
+                potentials[i] = potential_new
+                windows[i, window_counts[i] % window_length] = potential_new
+                window_counts[i] += 1
+                rec_accepted[step, i] = True
+                rec_positions[step, i, 0] = x_new
+                rec_positions[step, i, 1] = y_new
+                rec_potentials[step, i] = potential_new
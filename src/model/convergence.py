@@ -0,0 +1,94 @@
+"""
+Module providing the ConvergenceMonitor class, which decides when a simulation run can stop early.
+"""
+
+from collections import deque
+
+import numpy as np
+
+# Stop reasons recorded in the Result
+STOP_STEP_LIMIT = "step limit"  # all STEP_NUM steps were taken
+STOP_CONVERGED = "converged"  # stopped early by the convergence monitor
+
+# Steps between two samples of the monitored statistics
+SAMPLE_STEPS = 10
+
+# Fiber-fiber coefficient from which the sigmoid counts as saturated
+FF_SATURATION = 0.99
+
+
+class ConvergenceMonitor:
+    """
+    Samples the moving growth cones every SAMPLE_STEPS steps and tracks two statistics per sample: the summed
+    potential, and the mean distance the growth cones moved since the previous sample. The means of both over the
+    latest window of samples are compared to the means over the window before. The run has converged once the
+    fiber-fiber coefficient has saturated, so the potential landscape no longer changes by itself, and both means
+    changed by at most the relative tolerance.
+
+    Attributes:
+        window (int): Steps per window, rounded down to a multiple of SAMPLE_STEPS.
+        tolerance (float): Largest relative change of the statistics between two windows.
+        ff_saturation (float): Fiber-fiber coefficient from which the sigmoid counts as saturated.
+        sample_steps (int): Steps between two samples.
+        totals (deque): Summed potential at the samples of the latest two windows.
+        displacements (deque): Mean displacement at the samples of the latest two windows.
+        positions (np.ndarray): Positions of the moving growth cones at the previous sample.
+    """
+
+    def __init__(self, window, tolerance, ff_saturation=FF_SATURATION, sample_steps=SAMPLE_STEPS):
+        self.sample_steps = sample_steps
+        self.window = max(sample_steps, window - window % sample_steps)
+        self.tolerance = tolerance
+        self.ff_saturation = ff_saturation
+        self.totals = deque(maxlen=2 * (self.window // sample_steps))
+        self.displacements = deque(maxlen=2 * (self.window // sample_steps))
+        self.positions = None
+
+    def reset(self):
+        """
+        Drop all samples, e.g. before a new run.
+        """
+        self.totals.clear()
+        self.displacements.clear()
+        self.positions = None
+
+    def sample(self, xs, ys, potentials, ff_coef=None):
+        """
+        Record a sample and check for convergence.
+
+        :param xs: Positions and potentials of the moving growth cones.
+        :param ff_coef: Fiber-fiber coefficient of the last step, None without fiber-fiber interaction.
+        :return: True if the run has converged.
+        """
+        positions = np.column_stack((xs, ys)).astype(float)
+        if self.positions is not None:
+            self.totals.append(float(np.sum(potentials)))
+            self.displacements.append(mean_displacement(self.positions, positions))
+        self.positions = positions
+
+        if len(self.totals) < self.totals.maxlen:
+            return False
+        if ff_coef is not None and ff_coef < self.ff_saturation:
+            return False
+
+        half = self.window // self.sample_steps
+        totals = list(self.totals)
+        displacements = list(self.displacements)
+        return (plateaued(np.mean(totals[:half]), np.mean(totals[half:]), self.tolerance)
+                and plateaued(np.mean(displacements[:half]), np.mean(displacements[half:]), self.tolerance))
+
+
+def mean_displacement(positions_start, positions_end):
+    """
+    Mean Euclidean distance between the positions of the growth cones at two samples.
+    """
+    if not len(positions_start):
+        return 0.0
+    return float(np.mean(np.hypot(*(positions_end - positions_start).T)))
+
+
+def plateaued(before, after, tolerance):
+    """
+    Check whether a statistic changed by at most a relative tolerance.
+    """
+    return abs(after - before) <= tolerance * max(abs(before), abs(after))
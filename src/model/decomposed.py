@@ -0,0 +1,245 @@
+"""
+Module providing the DecomposedSimulation class, which splits the substrate into strips stepped by worker
+processes.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model import array_simulation
+from model.compiled import CompiledSimulation, numba, run_block
+
+# Worker processes, one per strip
+WORKERS = 4
+
+# Names of the kernel state arrays and records, in the order the kernel takes them
+STATE = ("xs", "ys", "ligands", "receptors", "potentials", "adap_cos", "reset_ligands", "reset_receptors",
+         "start_ligands", "start_receptors", "windows", "window_counts")
+RECORDS = ("rec_accepted", "rec_positions", "rec_potentials", "rec_adap_cos", "rec_ligands", "rec_receptors",
+           "rec_reset_ligands", "rec_reset_receptors")
+GRIDS = ("ligand_field", "receptor_field", "ligand_grid", "receptor_grid")
+
+
+class DecomposedSimulation(CompiledSimulation):
+    """
+    Splits the substrate into horizontal strips, each stepped by its own worker process. A worker owns the growth
+    cones inside its strip at the start of a step and reads the growth cones in its halo, the rows within
+    fiber-fiber range of any proposal from the strip, i.e. 2 * gc_size + step_size. Ownership is recomputed every
+    step, so growth cones migrate between workers as they cross strip boundaries. Strips are coloured alternately
+    and a step runs in two phases, even strips first, then odd strips. Strips are at least 2 * gc_size +
+    2 * step_size rows high, so strips of one colour never read each other's growth cones and run concurrently.
+
+    This is a different update order than the sequential sweep: a step equals a sweep over the growth cones of
+    even strips, then of odd strips, each in list order. Trajectories are reproducible for a seed and number of
+    strips, but differ from Simulation. The state lives in shared memory, and the substrate grids are shared by all
+    workers instead of being copied into slices. Workers run the compiled kernel of CompiledSimulation.
+    Configurations the kernel does not cover, and substrates too small for two strips, use the iteration of
+    CompiledSimulation. Without Numba, runs use the iteration of ArraySimulation and its sequential order, as the
+    workers would run the kernel interpreted.
+
+    Attributes:
+        workers (int): Largest number of strips and worker processes.
+        strip_height (int): Rows per strip, the last strip takes the remaining rows.
+        shared (dict): Arrays in shared memory, by name, see share_arrays.
+        blocks (list): Shared memory blocks backing the shared arrays.
+        processes (list): Worker process of every strip.
+        connections (list): Pipe to the worker process of every strip.
+    """
+
+    def __init__(self, *args, workers=WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+        self.strip_height = 0
+        self.shared = None
+        self.blocks = []
+        self.processes = []
+        self.connections = []
+
+    def iterate_simulation(self):
+        if numba is None:
+            array_simulation.ArraySimulation.iterate_simulation(self)
+            return
+        if not self.decomposed_supported():
+            super().iterate_simulation()
+            return
+
+        self.strip_height = self.substrate.rows // self.strip_count()
+        try:
+            array_simulation.ArraySimulation.iterate_simulation(self)
+        finally:
+            self.stop_workers()
+
+    def decomposed_supported(self):
+        """
+        Check whether Numba is installed, the kernel covers the configuration and the substrate splits into at least
+        two strips.
+        """
+        return numba is not None and self.compiled_supported() and self.strip_count() >= 2
+
+    def strip_count(self):
+        """
+        Return the number of strips, limited by the number of workers and the smallest strip height.
+        """
+        min_height = 2 * self.growth_cones[0].size + 2 * self.step_size
+        return min(self.workers, self.substrate.rows // min_height)
+
+    def run_block(self, step_first, uniforms, active, records):
+        if not self.strip_height:
+            if numba is None:
+                array_simulation.ArraySimulation.run_block(self, step_first, uniforms, active, records)
+            else:
+                super().run_block(step_first, uniforms, active, records)
+            return
+        if self.shared is None:
+            self.start_workers(uniforms.shape[1:])
+
+        shared = self.shared
+        steps = uniforms.shape[0]
+        for name, values in zip(STATE, self.arrays.kernel_state()):
+            shared[name][...] = values
+        shared["uniforms"][:steps] = uniforms
+        for name in RECORDS:
+            shared[name][:steps] = 0
+
+        for step in range(steps):
+            self.run_step(step, step_first + step, active)
+
+        for name, values in zip(STATE, self.arrays.kernel_state()):
+            values[...] = shared[name]
+        for name, record in zip(RECORDS, records):
+            record[...] = shared[name][:steps]
+
+    def run_step(self, step, step_abs, active):
+        """
+        Run one step in two phases, handing the growth cones of every strip of a colour to its worker.
+        """
+        strips = np.minimum(self.shared["ys"][active] // self.strip_height, len(self.connections) - 1)
+        for colour in (0, 1):
+            running = []
+            for strip in range(colour, len(self.connections), 2):
+                positions = np.flatnonzero(strips == strip)
+                if len(positions):
+                    self.connections[strip].send((step, step_abs, active[positions], positions))
+                    running.append(strip)
+            for strip in running:
+                error = self.connections[strip].recv()
+                if error is not None:
+                    raise error
+
+    def start_workers(self, uniforms_shape):
+        """
+        Move the state, records, random numbers and per-run tables into shared memory and start one worker process
+        per strip.
+        """
+        areas, grids, params = self.kernel_tables()
+        arrays = dict(zip(STATE, self.arrays.kernel_state()))
+        arrays.update(zip(RECORDS, array_simulation.allocate_records(array_simulation.BLOCK_STEPS,
+                                                                     len(self.growth_cones))))
+        arrays.update(zip(GRIDS, grids))
+        arrays["uniforms"] = np.zeros((array_simulation.BLOCK_STEPS,) + uniforms_shape, dtype=float)
+        arrays["ff_coefs"] = self.ff_coefs
+        arrays["areas"] = areas
+        self.blocks, self.shared, layout = share_arrays(arrays)
+
+        context = multiprocessing.get_context()
+        halo = 2 * self.growth_cones[0].size + self.step_size
+        strip_count = self.strip_count()
+        for strip in range(strip_count):
+            low = strip * self.strip_height
+            high = self.substrate.rows if strip == strip_count - 1 else low + self.strip_height
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=run_worker, args=(worker_connection, layout, low - halo, high + halo,
+                                                               params), daemon=True)
+            process.start()
+            worker_connection.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+
+    def stop_workers(self):
+        """
+        Stop the worker processes and release the shared memory.
+        """
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+        # Arrays must be dropped before their blocks are closed
+        self.shared = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.strip_height = 0
+        self.blocks = []
+        self.processes = []
+        self.connections = []
+
+
+def run_worker(connection, layout, low, high, params):
+    """
+    Serve phases of one strip until told to stop. The growth cones with rows in [low, high), the strip and its halo,
+    are gathered into local arrays, the owned ones are stepped by the kernel and their state and records are written
+    back.
+    """
+    blocks, shared = attach_arrays(layout)
+    try:
+        while True:
+            command = connection.recv()
+            if command is None:
+                break
+            step, step_abs, owned, positions = command
+            try:
+                ys = shared["ys"]
+                local = np.flatnonzero((ys >= low) & (ys < high))
+                owned_local = np.searchsorted(local, owned)
+                state = [shared[name][local] for name in STATE]
+                records = array_simulation.allocate_records(1, len(local))
+
+                run_block(shared["ff_coefs"][step_abs:step_abs + 1], shared["uniforms"][step:step + 1, positions],
+                          owned_local, *state, *records, shared["areas"], *(shared[name] for name in GRIDS), *params)
+
+                for name, values in zip(STATE, state):
+                    shared[name][owned] = values[owned_local]
+                for name, record in zip(RECORDS, records):
+                    shared[name][step, owned] = record[0, owned_local]
+                connection.send(None)
+            except Exception as error:
+                connection.send(error)
+    finally:
+        shared.clear()
+        for block in blocks:
+            block.close()
+
+
+def share_arrays(arrays):
+    """
+    Copy arrays into new shared memory blocks.
+
+    :return: Tuple of the blocks, the shared arrays by name, and the layout to attach them in another process.
+    """
+    blocks = []
+    shared = {}
+    layout = {}
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        shared[name] = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+        shared[name][...] = values
+        layout[name] = block.name, values.shape, values.dtype.str
+        blocks.append(block)
+    return blocks, shared, layout
+
+
+def attach_arrays(layout):
+    """
+    Attach the shared arrays of a layout created by share_arrays.
+    """
+    blocks = []
+    shared = {}
+    for name, (block_name, shape, dtype) in layout.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        blocks.append(block)
+    return blocks, shared
@@ -0,0 +1,98 @@
+"""
+Module providing the FiberDensityField class, a particle-mesh alternative to pairwise fiber-fiber interaction.
+"""
+
+import numpy as np
+
+from model.potential_calculation import geometry_table
+
+
+class FiberDensityField:
+    """
+    Keeps the ligand and receptor values of all growth cones deposited on the substrate grid, convolved with the
+    pairwise overlap kernel. The fiber-fiber sums at a position are then a single lookup, however many growth cones
+    are nearby, and a move or adaptation only touches the cells within interaction range.
+
+    Attributes:
+        reach (int): Largest offset along an axis at which two growth cones still overlap.
+        kernel (np.ndarray): Overlap area for every offset within reach, indexed by [dy + reach, dx + reach].
+        ligands (np.ndarray): Convolved ligand deposits, padded by reach on every side of the substrate grid.
+        receptors (np.ndarray): Convolved receptor deposits, padded like ligands.
+    """
+
+    def __init__(self, substrate, growth_cones, gc_size):
+        """
+        Initializes the FiberDensityField with the deposits of all growth cones at their current positions.
+
+        :param substrate: Substrate providing the grid dimensions.
+        :param growth_cones: Growth cones depositing their signal values.
+        :param gc_size: Radius of the growth cones.
+        """
+        self.reach = max(0, 2 * gc_size - 1)
+        self.kernel = overlap_kernel(gc_size, self.reach)
+        shape = (substrate.rows + 2 * self.reach, substrate.cols + 2 * self.reach)
+        self.ligands = np.zeros(shape, dtype=float)
+        self.receptors = np.zeros(shape, dtype=float)
+
+        for gc in growth_cones:
+            self.deposit(gc.pos, gc.ligand_current, gc.receptor_current)
+
+    def deposit(self, pos, ligand, receptor):
+        """
+        Add signal values at a position, spread over all cells within reach by the overlap kernel.
+        """
+        x, y = pos
+        window = (slice(y, y + 2 * self.reach + 1), slice(x, x + 2 * self.reach + 1))
+        self.ligands[window] += self.kernel * ligand
+        self.receptors[window] += self.kernel * receptor
+
+    def sums_at(self, pos):
+        """
+        Return the summed deposits at a position.
+        """
+        x, y = pos
+        return self.ligands[y + self.reach, x + self.reach], self.receptors[y + self.reach, x + self.reach]
+
+    def ff_sums(self, gc, pos):
+        """
+        Return the fiber-fiber ligand and receptor sums of a growth cone at a position, without its own deposit.
+        """
+        x, y = pos
+        sum_ligands = self.ligands[y + self.reach, x + self.reach]
+        sum_receptors = self.receptors[y + self.reach, x + self.reach]
+
+        dx, dy = gc.pos[0] - x, gc.pos[1] - y
+        if abs(dx) <= self.reach and abs(dy) <= self.reach:
+            area = self.kernel[dy + self.reach, dx + self.reach]
+            sum_ligands -= area * gc.ligand_current
+            sum_receptors -= area * gc.receptor_current
+
+        return sum_ligands, sum_receptors
+
+    def on_move(self, gc, pos_old):
+        """
+        Move the deposit of a growth cone to its new position.
+        """
+        self.deposit(pos_old, -gc.ligand_current, -gc.receptor_current)
+        self.deposit(gc.pos, gc.ligand_current, gc.receptor_current)
+
+    def on_adapt(self, gc, ligand_old, receptor_old):
+        """
+        Update the deposit of a growth cone to its adapted signal values.
+        """
+        self.deposit(gc.pos, gc.ligand_current - ligand_old, gc.receptor_current - receptor_old)
+
+
+def overlap_kernel(gc_size, reach):
+    """
+    Tabulate the overlap area of two growth cones for every offset within reach. Offsets out of fiber-fiber
+    interaction range get zero, matching the distance test in ff_interaction.
+    """
+    areas = geometry_table(gc_size).area
+    kernel = np.zeros((2 * reach + 1, 2 * reach + 1), dtype=float)
+    for dy in range(-reach, reach + 1):
+        for dx in range(-reach, reach + 1):
+            d_squared = dx * dx + dy * dy
+            if d_squared < len(areas):
+                kernel[dy + reach, dx + reach] = areas[d_squared]
+    return kernel
@@ -3,6 +3,12 @@ Module providing Growth Cone class for growth cone representation.
 """
 import math
 
+import numpy as np
+
+from build import config
+from model.precision import quantize_legacy
+from model.trajectory import TrajectorySeries
+
 
 class GrowthCone:
     """
@@ -16,14 +22,18 @@ class GrowthCone:
         ligand_current (float): Ligand value of growth cone.
         receptor_current (float): Receptor value of growth cone.
         potential (float): Current potential of the growth cone.
+        window (AdaptationWindow): Latest potentials for adaptation, None until first needed.
     """
 
-    def __init__(self, position, size, ligand, receptor, id, freeze=False, marked=False):
+    def __init__(self, position, size, ligand, receptor, id, freeze=False, marked=False, quantize=quantize_legacy,
+                 dtype=np.float64):
         """
         Initializes a GrowthCone with parameters defined above.
 
         :param id: The unique identifier sorted along n-t axis of retina
         :param freeze: The toggle to freeze growth cone during simulation
+        :param quantize: Quantization of adapted values, taken from the precision policy
+        :param dtype: Dtype of the recorded quantized values, taken from the precision policy
         """
         self.pos = position
         self.size = size
@@ -36,9 +46,12 @@ class GrowthCone:
         self.id = id
         self.freeze = freeze  # needed for polarity reversal
         self.marked = marked  # needed to visualize two sets of GCs like in knock-in
+        self.quantize = quantize
+        self.trackers = []  # spatial indexes of the running simulation, notified on every move and adaptation
+        self.window = None
 
         self.history = History(self.potential, self.adap_co, self.pos, self.ligand_current, self.receptor_current,
-                               self.reset_force_receptor, self.reset_force_ligand)
+                               self.reset_force_receptor, self.reset_force_ligand, dtype)
 
     def __str__(self):
         """
@@ -55,9 +68,13 @@ class GrowthCone:
         """
         self.history.update_potential(potential_new)
         self.history.update_position(pos_new)
+        pos_old = self.pos
         self.potential = potential_new
         self.pos = pos_new
 
+        for tracker in self.trackers:
+            tracker.on_move(self, pos_old)
+
     def calculate_adaptation(self, mu, lambda_, h):
         """
         Calculate the adaptation coefficient and the resetting force based on the history.
@@ -67,15 +84,14 @@ class GrowthCone:
         :param h: The number of historical steps to consider for adaptation.
         """
         # Ensure we have enough history to calculate adaptation
-        if len(self.history.potential) >= h:
-            recent_history = self.history.potential[-h:]  # Get the last h elements from the history
+        if self.history.count("potential") >= h:
+            # Weighted sum of the last h potentials, k * |potential| for the k-th oldest
+            weighted = self.adaptation_window(h).weighted if h > 0 else 0
 
             # Calculate the adaptation coefficient using the formula from the paper
-            adap_co_temp = 1 + math.log(
-                1 + mu * sum(k * abs(potential_diff) for k, potential_diff in enumerate(recent_history, 1)) / sum(
-                    range(1, h + 1)))
+            adap_co_temp = 1 + math.log(1 + mu * weighted / sum(range(1, h + 1)))
 
-            self.adap_co = float("{:.6f}".format(adap_co_temp))
+            self.adap_co = self.quantize(adap_co_temp)
 
             # Calculate the resetting force
             self.reset_force_receptor = lambda_ * (self.get_start_receptor() - self.receptor_current)
@@ -85,21 +101,38 @@ class GrowthCone:
         self.history.update_reset_force_receptor(self.reset_force_receptor)
         self.history.update_reset_force_ligand(self.reset_force_ligand)
 
+    def adaptation_window(self, h):
+        """
+        Return the adaptation window over the last h potentials, brought in sync with the history. A window one
+        potential behind is advanced by it, any other window is rebuilt from the history.
+        """
+        count = self.history.count("potential")
+        window = self.window
+        if window is not None and window.length == h and window.count + 1 == count:
+            window.push(self.history.latest("potential", 1)[0])
+        elif window is None or window.length != h or window.count != count:
+            window = self.window = AdaptationWindow(self.history.latest("potential", h), count)
+        return window
+
     def apply_adaptation(self):
         """
         Apply the adaptation coefficient and resetting force to the ligand and receptor values.
         """
+        ligand_old, receptor_old = self.ligand_current, self.receptor_current
         ligand_temp = self.ligand_current * self.adap_co
         receptor_temp = self.receptor_current * self.adap_co
         ligand_temp = max(0, ligand_temp + self.reset_force_ligand)
         receptor_temp = max(0, receptor_temp + self.reset_force_receptor)
 
-        self.ligand_current = float("{:.6f}".format(ligand_temp))
-        self.receptor_current = float("{:.6f}".format(receptor_temp))
+        self.ligand_current = self.quantize(ligand_temp)
+        self.receptor_current = self.quantize(receptor_temp)
 
         self.history.update_ligand(self.ligand_current)
         self.history.update_receptor(self.receptor_current)
 
+        for tracker in self.trackers:
+            tracker.on_adapt(self, ligand_old, receptor_old)
+
     def mutate(self, knock_in):
         """
         Mutate the growth cones. Used for knock-in experiment.
@@ -108,43 +141,326 @@ class GrowthCone:
         self.ligand_current = 0.35 / self.receptor_current
 
     def get_start_pos(self):
-        return self.history.position[0]
+        return self.history.first("position")
 
     def get_start_ligand(self):
-        return self.history.ligand[0]
+        return self.history.first("ligand")
 
     def get_start_receptor(self):
-        return self.history.receptor[0]
+        return self.history.first("receptor")
+
+
+class AdaptationWindow:
+    """
+    Absolute values of the latest potentials of a growth cone in a ring buffer, so adaptation does not slice the
+    history every step. The weighted sum, the k-th oldest potential weighted by k, is summed directly, oldest first,
+    exactly like the array engines and the compiled kernel sum it. A sliding window recurrence would update it in
+    O(1), but rounds differently and makes the engines diverge.
+
+    Attributes:
+        length (int): Number of potentials in the window, h.
+        ring (list): Absolute potentials of the window, potential number i at index i % length.
+        count (int): Number of potentials pushed in total, including the ones the window was built from.
+    """
+
+    def __init__(self, potentials, count):
+        """
+        :param potentials: The latest potentials, oldest first.
+        :param count: Number of potentials so far, the last one included.
+        """
+        self.length = len(potentials)
+        self.ring = [0.0] * self.length
+        for k, potential in enumerate(potentials, count - self.length):
+            self.ring[k % self.length] = abs(potential)
+        self.count = count
+
+    def push(self, potential):
+        """
+        Add a potential, dropping the oldest one.
+        """
+        self.ring[self.count % self.length] = abs(potential)
+        self.count += 1
+
+    @property
+    def weighted(self):
+        """
+        Weighted sum of the window, oldest first.
+        """
+        start = self.count % self.length if self.length else 0
+        ordered = self.ring[start:] + self.ring[:start]
+        return sum(k * value for k, value in enumerate(ordered, 1))
+
+
+def recorded(name):
+    """
+    Property exposing the recorded entries of a history series as an array view.
+    """
+    return property(lambda self: self.series[name].view(), doc=f"Recorded {name} entries.")
 
 
 class History:
+    """
+    Records the course of a growth cone. Position and potential get an entry for every accepted step, the
+    adaptation values for every step the growth cone adapts. Every series starts with the initial value.
+
+    Entries are stored in preallocated arrays, see Series, and read as array views through the attributes named
+    like the series. Potentials, adaptation coefficients and signal values are quantized by the precision policy
+    and stored in its dtype, resetting forces are not quantized and stay in double precision. The recording level
+    decides which entries are stored; the initial values, the number of entries and the latest potentials needed
+    for adaptation are kept at every level.
+
+    Attributes:
+        series (dict): Series of every recorded quantity, by name.
+    """
+
     def __init__(self, potential_ini, adap_co_ini, position_ini, ligand_ini, receptor_ini,
-                 reset_force_receptor_ini, reset_force_ligand_ini):
-        self.potential = [potential_ini]
-        self.adap_co = [adap_co_ini]
-        self.position = [position_ini]
-        self.ligand = [ligand_ini]
-        self.receptor = [receptor_ini]
-        self.reset_force_receptor = [reset_force_receptor_ini]
-        self.reset_force_ligand = [reset_force_ligand_ini]
+                 reset_force_receptor_ini, reset_force_ligand_ini, dtype=np.float64):
+        self.series = {
+            "potential": Series(potential_ini, dtype),
+            "adap_co": Series(adap_co_ini, dtype),
+            "position": Series(position_ini, np.int64, 2),
+            "ligand": Series(ligand_ini, dtype),
+            "receptor": Series(receptor_ini, dtype),
+            "reset_force_receptor": Series(reset_force_receptor_ini),
+            "reset_force_ligand": Series(reset_force_ligand_ini)
+        }
+
+    potential = recorded("potential")
+    adap_co = recorded("adap_co")
+    position = recorded("position")
+    ligand = recorded("ligand")
+    receptor = recorded("receptor")
+    reset_force_receptor = recorded("reset_force_receptor")
+    reset_force_ligand = recorded("reset_force_ligand")
+
+    def configure(self, level, interval=1, keep=0, encoding=config.TRAJECTORY_PLAIN, step_size=1):
+        """
+        Set the recording level of all series for the entries to come.
+
+        :param level: Recording level, see config.
+        :param interval: Every how many entries one is recorded at HISTORY_EVERY.
+        :param keep: Number of latest potentials kept at every level, e.g. the adaptation history length.
+        :param encoding: Storage of the positions, see config. Moves are only encoded at HISTORY_FULL.
+        :param step_size: Magnitude of a move on one axis, for move-encoded positions.
+        """
+        # A store belongs to the run that created it, later runs record in memory unless streamed again
+        self.series = {name: series.detach() for name, series in self.series.items()}
+        self.encode_positions(encoding == config.TRAJECTORY_MOVES and level == config.HISTORY_FULL, step_size)
+        for name, series in self.series.items():
+            series.configure(level, interval, keep if name == "potential" else 0)
+
+    def encode_positions(self, moves, step_size):
+        """
+        Store the positions move-encoded or plain, converting the ones recorded so far. Positions that were not all
+        recorded stay as they are, as the moves between them are unknown.
+        """
+        position = self.series["position"]
+        encoded = isinstance(position, TrajectorySeries)
+        if encoded == moves and (not moves or position.step_size == step_size):
+            return
+        if position.size != position.count:
+            return
+        series = TrajectorySeries(position.first, step_size) if moves else Series(position.first, np.int64, 2)
+        series.extend(position.view()[1:])
+        self.series["position"] = series
+
+    def stream(self, store, row):
+        """
+        Record the series to a row of a HistoryStore instead of memory, where the store takes them.
+        """
+        self.series = {name: store.attach(series, name, row) for name, series in self.series.items()}
+
+    def reserve(self, steps, adaptation=True):
+        """
+        Preallocate room for the entries of a number of steps, for the moves only without adaptation.
+        """
+        for name, series in self.series.items():
+            if adaptation or name in ("potential", "position"):
+                series.reserve(steps)
+
+    def count(self, name):
+        """
+        Return the number of entries of a series, including the ones not recorded.
+        """
+        return self.series[name].count
+
+    def first(self, name):
+        """
+        Return the initial value of a series.
+        """
+        return self.series[name].first
+
+    def latest(self, name, n):
+        """
+        Return up to the n latest entries of a series as a list, see Series.latest.
+        """
+        return self.series[name].latest(n)
+
+    def extend(self, name, values):
+        """
+        Append an array of entries to a series, e.g. the records of an array engine block.
+        """
+        self.series[name].extend(values)
 
     def update_potential(self, potential_new):
-        self.potential.append(potential_new)
+        self.series["potential"].append(potential_new)
 
     def update_adap_co(self, adap_co_new):
-        self.adap_co.append(adap_co_new)
+        self.series["adap_co"].append(adap_co_new)
 
     def update_position(self, adap_position_new):
-        self.position.append(adap_position_new)
+        self.series["position"].append(adap_position_new)
 
     def update_ligand(self, ligand_new):
-        self.ligand.append(ligand_new)
+        self.series["ligand"].append(ligand_new)
 
     def update_receptor(self, receptor_new):
-        self.receptor.append(receptor_new)
+        self.series["receptor"].append(receptor_new)
 
     def update_reset_force_receptor(self, reset_force_receptor_new):
-        self.reset_force_receptor.append(reset_force_receptor_new)
+        self.series["reset_force_receptor"].append(reset_force_receptor_new)
 
     def update_reset_force_ligand(self, reset_force_ligand_new):
-        self.reset_force_ligand.append(reset_force_ligand_new)
+        self.series["reset_force_ligand"].append(reset_force_ligand_new)
+
+
+class Series:
+    """
+    One quantity of a growth cone history, recorded into a preallocated array that grows when it runs full.
+
+    Which entries are recorded depends on the level: all of them (HISTORY_FULL), every interval-th entry
+    (HISTORY_EVERY), only the latest one after the initial value (HISTORY_FINAL), or none (HISTORY_NONE). The initial
+    value is always recorded, as it is appended before a level is set.
+
+    Attributes:
+        values (np.ndarray): Storage, the first size entries are the recorded ones.
+        size (int): Number of recorded entries.
+        count (int): Number of appended entries, recorded or not.
+        first: Initial value.
+        level (str): Recording level, see config.
+        interval (int): Every how many entries one is recorded at HISTORY_EVERY.
+        tail (np.ndarray): Ring buffer of the latest appended entries, whatever the level. Empty if none are kept.
+    """
+
+    def __init__(self, first, dtype=float, width=None):
+        self.shape = () if width is None else (width,)
+        self.values = np.empty((1,) + self.shape, dtype=dtype)
+        self.values[0] = first
+        self.size = 1
+        self.count = 1
+        self.first = first
+        self.level = config.HISTORY_FULL
+        self.interval = 1
+        self.tail = self.values[:0]
+
+    def view(self):
+        """
+        Return the recorded entries.
+        """
+        return self.values[:self.size]
+
+    def detach(self):
+        """
+        Return the series holding its recorded entries in memory, itself.
+        """
+        return self
+
+    def configure(self, level, interval=1, keep=0):
+        """
+        Set the recording level for the entries to come and the number of latest entries kept in the ring buffer.
+        """
+        if level not in (config.HISTORY_NONE, config.HISTORY_FINAL, config.HISTORY_EVERY, config.HISTORY_FULL):
+            raise ValueError("History level unknown")
+        latest = self.latest(keep)
+        self.level = level
+        self.interval = max(1, interval)
+        self.tail = np.empty((keep,) + self.shape, dtype=self.values.dtype)
+        for k, value in enumerate(latest, self.count - len(latest)):
+            self.tail[k % keep] = value
+
+    def reserve(self, entries):
+        """
+        Preallocate room for the records of a number of entries to come.
+        """
+        if self.level == config.HISTORY_FULL:
+            needed = self.size + entries
+        elif self.level == config.HISTORY_EVERY:
+            needed = self.size + entries // self.interval + 1
+        elif self.level == config.HISTORY_FINAL:
+            needed = max(self.size, 2)
+        else:
+            needed = self.size
+        if needed > len(self.values):
+            self.resize(needed)
+
+    def resize(self, capacity):
+        """
+        Move the recorded entries into storage of a new capacity.
+        """
+        values = np.empty((capacity,) + self.shape, dtype=self.values.dtype)
+        values[:self.size] = self.values[:self.size]
+        self.values = values
+
+    def append(self, value):
+        """
+        Append an entry, recording it if the level asks for it.
+        """
+        index = self.count
+        self.count += 1
+        if len(self.tail):
+            self.tail[index % len(self.tail)] = value
+
+        if self.level == config.HISTORY_FULL or (self.level == config.HISTORY_EVERY and index % self.interval == 0):
+            if self.size == len(self.values):
+                self.resize(2 * self.size)
+            self.values[self.size] = value
+            self.size += 1
+        elif self.level == config.HISTORY_FINAL:
+            self.append_final(value)
+
+    def extend(self, values):
+        """
+        Append an array of entries, recording them like append would.
+        """
+        values = np.asarray(values, dtype=self.values.dtype).reshape((-1,) + self.shape)
+        if not len(values):
+            return
+        indexes = np.arange(self.count, self.count + len(values))
+        self.count += len(values)
+        if len(self.tail):
+            self.tail[indexes[-len(self.tail):] % len(self.tail)] = values[-len(self.tail):]
+
+        if self.level == config.HISTORY_FINAL:
+            self.append_final(values[-1])
+            return
+        if self.level == config.HISTORY_EVERY:
+            values = values[indexes % self.interval == 0]
+        elif self.level == config.HISTORY_NONE:
+            return
+
+        if self.size + len(values) > len(self.values):
+            self.resize(max(2 * len(self.values), self.size + len(values)))
+        self.values[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def append_final(self, value):
+        """
+        Record the latest entry after the initial value at HISTORY_FINAL.
+        """
+        if self.size < 2 or not self.values.flags.writeable:
+            # Read-only entries, e.g. left in the memory map of a closed HistoryStore, are copied before overwriting
+            self.resize(max(self.size, 2))
+            self.size = max(self.size, 2)
+        self.values[self.size - 1] = value
+
+    def latest(self, n):
+        """
+        Return up to the n latest entries as a list. They are read from the recorded entries if all entries were
+        recorded, and from the ring buffer otherwise, which must then hold at least n entries.
+        """
+        n = min(n, self.count)
+        if n <= 0:
+            return []
+        if self.size == self.count or n > len(self.tail):
+            return self.values[max(0, self.size - n):self.size].tolist()
+        return self.tail[np.arange(self.count - n, self.count) % len(self.tail)].tolist()
@@ -0,0 +1,303 @@
+"""
+Module providing the HistoryStore class, which streams growth cone histories to memory-mapped files.
+"""
+
+import os
+import queue
+import tempfile
+import threading
+
+import numpy as np
+
+from build import config
+from model.growth_cone import Series
+
+# Entries per chunk handed to the writer
+CHUNK = 4096
+
+SIZES_FILE = "sizes.npz"
+
+# Recording levels whose entries grow with the number of steps, the only ones worth streaming
+STREAMED_LEVELS = (config.HISTORY_FULL, config.HISTORY_EVERY)
+
+
+class HistoryStore:
+    """
+    Keeps the recorded entries of the history series of a run in one memory-mapped .npy file per series, a row per
+    growth cone. Histories hand full chunks of entries to a background writer thread, so recording never waits for
+    the disk, and only the chunk being filled stays in memory.
+
+    Rows are read as memory maps sliced to the recorded entries, so reading part of a series only loads the pages
+    it touches. A store written by a run can be opened again later with HistoryStore.open.
+
+    Attributes:
+        directory (str): Directory of the files.
+        sizes (dict): Number of recorded entries of every row, by series name.
+        maps (dict): Memory maps of the series files, opened on first access when reading a closed store.
+        chunk (int): Entries per chunk.
+        attached (list): Streamed series, flushed on close.
+        pending (queue.Queue): Chunks waiting for the writer, as (name, row, start, entries).
+        writer (threading.Thread): Writes the pending chunks, None once the store is closed.
+        error (Exception): First error the writer ran into, raised by wait and close. None if there was none.
+    """
+
+    def __init__(self, directory, specs, rows, chunk=CHUNK):
+        """
+        Create the files of a store for writing.
+
+        :param directory: Directory of the files, created if missing.
+        :param specs: Row capacity, entry shape and dtype of every streamed series, by name.
+        :param rows: Number of rows, one per growth cone.
+        :param chunk: Entries per chunk.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sizes = {name: np.zeros(rows, dtype=np.int64) for name in specs}
+        self.maps = {name: np.lib.format.open_memmap(self.path(name), mode="w+", dtype=dtype,
+                                                     shape=(rows, capacity) + shape)
+                     for name, (capacity, shape, dtype) in specs.items()}
+        self.chunk = chunk
+        self.attached = []
+        self.pending = queue.Queue()
+        self.error = None
+        self.writer = threading.Thread(target=self.write_pending, daemon=True)
+        self.writer.start()
+
+    @classmethod
+    def for_histories(cls, directory, histories, steps, chunk=CHUNK):
+        """
+        Create a store with room for a run of a number of steps, for the series recorded in memory at a level that
+        grows with the steps. Rows follow the order of the histories.
+        """
+        specs = {}
+        for history in histories:
+            for name, series in history.series.items():
+                if type(series) is not Series or series.level not in STREAMED_LEVELS:
+                    continue
+                entries = steps if series.level == config.HISTORY_FULL else steps // series.interval + 1
+                capacity = max(specs[name][0] if name in specs else 0, series.size + entries)
+                specs[name] = capacity, series.shape, series.values.dtype
+        return cls(directory, specs, len(histories), chunk)
+
+    @classmethod
+    def for_run(cls, directory, histories, steps, chunk=CHUNK):
+        """
+        Create a store in a new run directory below a directory, see for_histories.
+        """
+        os.makedirs(directory, exist_ok=True)
+        return cls.for_histories(tempfile.mkdtemp(prefix="run_", dir=directory), histories, steps, chunk)
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Open the store written to a directory for reading.
+        """
+        store = cls.__new__(cls)
+        store.directory = directory
+        with np.load(os.path.join(directory, SIZES_FILE)) as sizes:
+            store.sizes = {name: sizes[name] for name in sizes.files}
+        store.maps = {}
+        store.chunk = CHUNK
+        store.attached = []
+        store.pending = None
+        store.error = None
+        store.writer = None
+        return store
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def series(self, name, row):
+        """
+        Return the recorded entries of a series of one growth cone as a memory map.
+        """
+        if name not in self.maps:
+            self.maps[name] = np.load(self.path(name), mmap_mode="r")
+        return self.maps[name][row, :self.sizes[name][row]]
+
+    def attach(self, series, name, row):
+        """
+        Return a series streaming to a row of the store in place of a series recorded in memory. Series the store
+        has no file for, or whose level does not grow with the steps, are returned unchanged.
+        """
+        if self.writer is None or name not in self.maps or type(series) is not Series or \
+                series.level not in STREAMED_LEVELS:
+            return series
+        streamed = StreamedSeries(series, self, name, row)
+        self.attached.append(streamed)
+        return streamed
+
+    def submit(self, name, row, start, entries):
+        """
+        Queue entries for writing to a row, starting at an entry index. The entries must not be modified afterwards.
+        """
+        self.sizes[name][row] = start + len(entries)
+        self.pending.put((name, row, start, entries))
+
+    def write_pending(self):
+        """
+        Write queued chunks until the store is closed. Errors are recorded instead of ending the writer, so the
+        queue keeps draining and waiting for it never hangs.
+        """
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                return
+            try:
+                name, row, start, entries = item
+                self.maps[name][row, start:start + len(entries)] = entries
+            except Exception as error:
+                if self.error is None:
+                    self.error = error
+            finally:
+                self.pending.task_done()
+
+    def wait(self):
+        """
+        Block until every queued chunk is written, raising the first error of the writer.
+        """
+        if self.writer is not None:
+            self.pending.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Flush the buffered entries of all streamed series, stop the writer and save the row sizes. Raises the first
+        error of the writer instead of saving the sizes, as the files then miss entries.
+        """
+        if self.writer is None:
+            return
+        for series in self.attached:
+            series.flush()
+        self.pending.put(None)
+        self.writer.join()
+        self.writer = None
+        if self.error is not None:
+            raise self.error
+        for memmap in self.maps.values():
+            memmap.flush()
+        np.savez(os.path.join(self.directory, SIZES_FILE), **self.sizes)
+
+
+class StreamedSeries(Series):
+    """
+    Series whose recorded entries go to a row of a HistoryStore. Entries are collected in a chunk buffer, which is
+    handed to the writer once full and replaced by a new one. The ring buffer of the latest entries is kept as in
+    Series, so adaptation never reads from the store.
+
+    Attributes:
+        store (HistoryStore): Store the entries are written to.
+        name (str): Name of the series in the store.
+        row (int): Row of the growth cone in the store.
+        flushed (int): Number of recorded entries handed to the store, the buffer holds the ones after them.
+    """
+
+    def __init__(self, series, store, name, row):
+        """
+        Take over a series recorded in memory, writing its recorded entries to the store.
+        """
+        self.shape = series.shape
+        self.first = series.first
+        self.count = series.count
+        self.size = series.size
+        self.level = series.level
+        self.interval = series.interval
+        self.tail = series.tail
+        self.store = store
+        self.name = name
+        self.row = row
+        self.values = np.empty((store.chunk,) + self.shape, dtype=series.values.dtype)
+
+        store.maps[name][row, :series.size] = series.view()
+        store.sizes[name][row] = series.size
+        self.flushed = series.size
+
+    def detach(self):
+        """
+        Return a series no longer streaming to the store, e.g. to record the next run in memory. Its recorded
+        entries stay in the memory map of the store, read-only, and are only copied into memory once entries are
+        recorded after them.
+        """
+        series = Series(self.first, self.values.dtype, self.shape[0] if self.shape else None)
+        series.values = self.view().view()
+        series.values.flags.writeable = False
+        series.size = self.size
+        series.count = self.count
+        series.level = self.level
+        series.interval = self.interval
+        series.tail = self.tail
+        return series
+
+    def flush(self):
+        """
+        Hand the buffered entries to the store and start a new buffer.
+        """
+        if self.size > self.flushed:
+            self.store.submit(self.name, self.row, self.flushed, self.values[:self.size - self.flushed])
+            self.flushed = self.size
+            self.values = np.empty_like(self.values)
+
+    def view(self):
+        """
+        Return the recorded entries as a memory map, after writing the queued and buffered ones.
+        """
+        self.store.wait()
+        self.store.maps[self.name][self.row, self.flushed:self.size] = self.values[:self.size - self.flushed]
+        return self.store.maps[self.name][self.row, :self.size]
+
+    def reserve(self, entries):
+        """
+        Rows of the store are allocated for the whole run, nothing to reserve.
+        """
+
+    def append(self, value):
+        """
+        Append an entry, recording it if the level asks for it.
+        """
+        index = self.count
+        self.count += 1
+        if len(self.tail):
+            self.tail[index % len(self.tail)] = value
+
+        if self.level == config.HISTORY_FULL or index % self.interval == 0:
+            self.values[self.size - self.flushed] = value
+            self.size += 1
+            if self.size - self.flushed == len(self.values):
+                self.flush()
+
+    def extend(self, values):
+        """
+        Append an array of entries, recording them like append would.
+        """
+        values = np.asarray(values, dtype=self.values.dtype).reshape((-1,) + self.shape)
+        if not len(values):
+            return
+        indexes = np.arange(self.count, self.count + len(values))
+        self.count += len(values)
+        if len(self.tail):
+            self.tail[indexes[-len(self.tail):] % len(self.tail)] = values[-len(self.tail):]
+        if self.level == config.HISTORY_EVERY:
+            values = values[indexes % self.interval == 0]
+
+        while len(values):
+            buffered = self.size - self.flushed
+            taken = min(len(values), len(self.values) - buffered)
+            self.values[buffered:buffered + taken] = values[:taken]
+            self.size += taken
+            values = values[taken:]
+            if self.size - self.flushed == len(self.values):
+                self.flush()
+
+    def latest(self, n):
+        """
+        Return up to the n latest entries as a list, from the ring buffer if it holds them and from the store
+        otherwise.
+        """
+        n = min(n, self.count)
+        if n <= 0:
+            return []
+        if n > len(self.tail):
+            return self.view()[max(0, self.size - n):].tolist()
+        return self.tail[np.arange(self.count - n, self.count) % len(self.tail)].tolist()
@@ -0,0 +1,35 @@
+"""
+Module providing the NeighbourSums class, which sums fiber-fiber interaction over the neighbours in a cell list.
+"""
+
+from model.potential_calculation import ff_interaction
+
+
+class NeighbourSums:
+    """
+    Provides the fiber-fiber sums of pairwise interaction: a scan over the growth cones in the cell list block
+    around a position, started from the deposits of the frozen growth cones in the static field.
+
+    Attributes:
+        cell_list (CellList): Neighbour index of the simulation, providing the cached neighbour lists.
+        static_field (FiberDensityField): Deposits of the frozen growth cones leading the list, which the neighbour
+            scans start from, None if there are none.
+    """
+
+    def __init__(self, cell_list, static_field=None):
+        self.cell_list = cell_list
+        self.static_field = static_field
+
+    def static_sums(self, pos):
+        """
+        Return the fiber-fiber sums of the frozen growth cones in the static field at a position.
+        """
+        if self.static_field is None:
+            return 0, 0
+        return self.static_field.sums_at(pos)
+
+    def ff_sums(self, gc, pos):
+        """
+        Return the fiber-fiber ligand and receptor sums of a growth cone at a position.
+        """
+        return ff_interaction(gc, pos, self.cell_list.neighbours(pos), *self.static_sums(pos))
@@ -4,11 +4,19 @@ programming to ensure correct behaviour and full test coverage
 """
 
 import math
+from collections import namedtuple
+from functools import lru_cache
+
 import numpy as np
 
+from model.precision import quantize_legacy
+
+# Geometry kernels tabulated by squared integer offset, see geometry_table
+GeometryTable = namedtuple("GeometryTable", ["distance", "area", "in_circle"])
+
 
 def calculate_potential(gc, pos, gcs, substrate, forward_on, reverse_on, ff_inter_on, ft_inter_on,
-                        step, num_steps, sigmoid_steepness, sigmoid_shift):
+                        step, num_steps, sigmoid_steepness, sigmoid_shift, ff_source=None, quantize=quantize_legacy):
     """
     Calculate guidance potential for a growth cone (gc) in a model.
 
@@ -16,6 +24,9 @@ def calculate_potential(gc, pos, gcs, substrate, forward_on, reverse_on, ff_inte
     :param gcs: List of other growth cones (for fiber-fiber interaction).
     :param substrate: Substrate object (for fiber-target interaction).
     :param ff_coef: The iteration of the simulation processed by a sigmoid function (used for fiber-fiber interaction).
+    :param ff_source: Optional provider of ff_sums(gc, pos), e.g. a FiberDensityField or NeighbourSums, to read the
+        fiber-fiber sums from instead of scanning gcs.
+    :param quantize: Quantization of the signals, taken from the precision policy.
     :return: The guidance potential as a floating-point number.
     """
 
@@ -29,18 +40,85 @@ def calculate_potential(gc, pos, gcs, substrate, forward_on, reverse_on, ff_inte
         ft_ligands, ft_receptors = ft_interaction(gc, pos, substrate)
     if ff_inter_on:
         ff_coef = calculate_ff_coef(step, num_steps, sigmoid_steepness, sigmoid_shift)
-        ff_ligands, ff_receptors = ff_interaction(gc, pos, gcs)
+        if ff_source is None:
+            ff_ligands, ff_receptors = ff_interaction(gc, pos, gcs)
+        else:
+            ff_ligands, ff_receptors = ff_source.ff_sums(gc, pos)
+
+    return potential_from_sums(gc, ft_ligands, ft_receptors, ff_ligands, ff_receptors, ff_coef, forward_on,
+                               reverse_on, quantize)
+
+
+def potential_from_sums(gc, ft_ligands, ft_receptors, ff_ligands, ff_receptors, ff_coef, forward_on, reverse_on,
+                        quantize=quantize_legacy):
+    """
+    Calculate the guidance potential of a growth cone from its fiber-target and fiber-fiber interaction sums.
+    """
+    forward_sig, reverse_sig = guidance_signals(gc.ligand_current, gc.receptor_current, ft_ligands, ft_receptors,
+                                                ff_ligands, ff_receptors, ff_coef, forward_on, reverse_on)
+    return signal_potential(forward_sig, reverse_sig, quantize)
+
+
+def guidance_signals(ligand, receptor, ft_ligands, ft_receptors, ff_ligands, ff_receptors, ff_coef, forward_on,
+                     reverse_on, zero=0):
+    """
+    Calculate the forward and reverse signals of a growth cone from its signal values and interaction sums. Works
+    on scalars and elementwise on arrays, in which case zero should be an array of zeros of the same shape. Plain
+    arithmetic only, so the compiled kernel compiles it too.
 
-    # Calculate the forward and reverse signals based on flags
-    forward_sig = reverse_sig = 0
+    :return: Forward and reverse signal, zero for a signal that is switched off.
+    """
+    forward_sig = reverse_sig = zero
     if forward_on:
-        forward_sig = gc.receptor_current * (ft_ligands + gc.ligand_current + (ff_coef * ff_ligands))
+        forward_sig = receptor * (ft_ligands + ligand + (ff_coef * ff_ligands))
     if reverse_on:
-        reverse_sig = gc.ligand_current * (ft_receptors + gc.receptor_current + (ff_coef * ff_receptors))
+        reverse_sig = ligand * (ft_receptors + receptor + (ff_coef * ff_receptors))
+    return forward_sig, reverse_sig
+
+
+def calculate_potentials_batch(gc, positions, gcs, substrate, forward_on, reverse_on, ff_inter_on, ft_inter_on,
+                               step, num_steps, sigmoid_steepness, sigmoid_shift, ff_source=None,
+                               quantize=quantize_legacy):
+    """
+    Calculate the guidance potentials of a growth cone (gc) at several positions at once, e.g. all candidate moves.
+    Parameters as in calculate_potential, the results are identical to calling it for every position.
+
+    :param positions: Sequence of (x, y) positions to evaluate.
+    :param gcs: List of other growth cones near any of the positions (for fiber-fiber interaction).
+    :return: Array with the guidance potential for every position.
+    """
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+    zeros = np.zeros(len(positions))
+
+    # Initialize interaction values
+    ft_ligands, ft_receptors = zeros, zeros
+    ff_ligands, ff_receptors = zeros, zeros
+    ff_coef = 0
 
+    # Compute interactions only if needed
+    if ft_inter_on:
+        ft_ligands, ft_receptors = ft_interaction_batch(gc, positions, substrate)
+    if ff_inter_on:
+        ff_coef = calculate_ff_coef(step, num_steps, sigmoid_steepness, sigmoid_shift)
+        if ff_source is None:
+            ff_ligands, ff_receptors = ff_interaction_batch(gc, positions, gcs)
+        else:
+            sums = [ff_source.ff_sums(gc, pos) for pos in positions]
+            ff_ligands, ff_receptors = np.array(sums, dtype=float).reshape(-1, 2).T
+
+    forward_sig, reverse_sig = guidance_signals(gc.ligand_current, gc.receptor_current, ft_ligands, ft_receptors,
+                                                ff_ligands, ff_receptors, ff_coef, forward_on, reverse_on, zeros)
+    return np.array([signal_potential(forward, reverse, quantize)
+                     for forward, reverse in zip(forward_sig, reverse_sig)], dtype=float)
+
+
+def signal_potential(forward_sig, reverse_sig, quantize=quantize_legacy):
+    """
+    Calculate the guidance potential from the forward and reverse signals.
+    """
     # Round and calculate the potential
-    forward_sig = float("{:.6f}".format(forward_sig))
-    reverse_sig = float("{:.6f}".format(reverse_sig))
+    forward_sig = quantize(forward_sig)
+    reverse_sig = quantize(reverse_sig)
 
     # Return calculated log difference or handle case when both signals are zero
     if forward_sig == 0 and reverse_sig == 0:
@@ -51,6 +129,39 @@ def calculate_potential(gc, pos, gcs, substrate, forward_on, reverse_on, ff_inte
 def ft_interaction(gc, pos, substrate):
     """
     Calculate fiber-target interaction between a growth cone and a substrate.
+
+    The sums are looked up in the footprint fields cached on the substrate. Footprints cut off by the substrate
+    border are not covered by the fields and are summed up directly.
+    """
+    sums = substrate.footprint_sums(pos, gc.size)
+    if sums is None:
+        return ft_interaction_direct(gc, pos, substrate)
+    return sums
+
+
+def ft_interaction_batch(gc, positions, substrate):
+    """
+    Calculate fiber-target interaction of a growth cone at an array of positions with one field lookup.
+    """
+    xs, ys = positions[:, 0], positions[:, 1]
+    size = gc.size
+    covered = (xs >= size) & (xs < substrate.cols - size) & (ys >= size) & (ys < substrate.rows - size)
+
+    ligand_field, receptor_field = substrate.get_footprint_fields(size)
+    sum_ligands = np.zeros(len(positions))
+    sum_receptors = np.zeros(len(positions))
+    sum_ligands[covered] = ligand_field[ys[covered], xs[covered]]
+    sum_receptors[covered] = receptor_field[ys[covered], xs[covered]]
+
+    for i in np.flatnonzero(~covered):
+        sum_ligands[i], sum_receptors[i] = ft_interaction_direct(gc, (xs[i], ys[i]), substrate)
+
+    return sum_ligands, sum_receptors
+
+
+def ft_interaction_direct(gc, pos, substrate):
+    """
+    Calculate fiber-target interaction by walking all substrate cells covered by the growth cone.
     """
 
     borders = bounding_box(pos, gc.size, substrate)
@@ -67,16 +178,41 @@ def ft_interaction(gc, pos, substrate):
             d = euclidean_distance(center, (i, j))
             if d > edge_length / 2:
                 # Eliminate cells outside of the circle, as borders define a square matrix
-                continue  # TODO: @Performance Use a precalculated mask
+                continue
             sum_ligands += substrate.ligands[i, j]
             sum_receptors += substrate.receptors[i, j]
 
     return sum_ligands, sum_receptors
 
 
-def ff_interaction(gc1, pos, gcs):
+def ff_interaction(gc1, pos, gcs, sum_ligands=0, sum_receptors=0):
     """
     Calculate the fiber-fiber interaction between a growth cone (gc1) and a list of other growth cones (gcs).
+    The list may be narrowed down to the candidates near pos beforehand, e.g. by a CellList.
+
+    :param sum_ligands: Sums to add the contributions to, e.g. those of the growth cones before gcs in the list.
+    """
+    areas = geometry_table(gc1.size).area
+    in_range = len(areas)  # squared offsets below this are closer than gc1.size * 2
+
+    for gc2 in gcs:
+        if gc1 == gc2:
+            # Eliminate self from the gcs list, as self-comparison always matches
+            continue
+        dx = gc2.pos[0] - pos[0]
+        dy = gc2.pos[1] - pos[1]
+        d_squared = dx * dx + dy * dy
+        if d_squared < in_range:
+            area = areas[d_squared]
+            sum_ligands += area * gc2.ligand_current
+            sum_receptors += area * gc2.receptor_current
+
+    return sum_ligands, sum_receptors
+
+
+def ff_interaction_direct(gc1, pos, gcs):
+    """
+    Calculate the fiber-fiber interaction by computing distance and overlap of every pair from scratch.
     """
     sum_ligands = 0
     sum_receptors = 0
@@ -85,7 +221,6 @@ def ff_interaction(gc1, pos, gcs):
         if gc1 == gc2:
             # Eliminate self from the gcs list, as self-comparison always matches
             continue
-        # TODO: @Performance Sort GCs based on location and use pruning algorithms
         d = euclidean_distance(gc2.pos, pos)
         if d < gc1.size * 2:
             area = intersection_area(pos, gc2.pos, gc1.size)
@@ -95,6 +230,37 @@ def ff_interaction(gc1, pos, gcs):
     return sum_ligands, sum_receptors
 
 
+def ff_interaction_batch(gc1, positions, gcs, sum_ligands=0, sum_receptors=0):
+    """
+    Calculate the fiber-fiber interaction of a growth cone (gc1) at an array of positions with a list of other
+    growth cones (gcs), sharing the neighbour list between all positions.
+
+    :param sum_ligands: Sums to add the contributions to, as in ff_interaction.
+    """
+    starts = np.full((len(positions), 1), sum_ligands, dtype=float), np.full((len(positions), 1), sum_receptors,
+                                                                             dtype=float)
+    others = [gc2 for gc2 in gcs if gc2 != gc1]
+    if not others:
+        return starts[0][:, 0], starts[1][:, 0]
+
+    # Out of range offsets are clipped onto a trailing zero area
+    areas = np.append(geometry_table(gc1.size).area, 0.0)
+    in_range = len(areas) - 1
+
+    others_pos = np.array([gc2.pos for gc2 in others], dtype=np.int64)
+    dx = others_pos[np.newaxis, :, 0] - positions[:, np.newaxis, 0]
+    dy = others_pos[np.newaxis, :, 1] - positions[:, np.newaxis, 1]
+    area = areas[np.minimum(dx * dx + dy * dy, in_range)]
+
+    ligands = np.array([gc2.ligand_current for gc2 in others], dtype=float)
+    receptors = np.array([gc2.receptor_current for gc2 in others], dtype=float)
+
+    # Cumulative sums add the contributions in list order, exactly like ff_interaction
+    sum_ligands = np.cumsum(np.hstack((starts[0], area * ligands)), axis=1)[:, -1]
+    sum_receptors = np.cumsum(np.hstack((starts[1], area * receptors)), axis=1)[:, -1]
+    return sum_ligands, sum_receptors
+
+
 def calculate_ff_coef(step, num_steps, sigmoid_steepness, sigmoid_shift, sigmoid_height=1):
     """
     Calculate the ratio of steps taken using a sigmoid function, scaled by sigmoid_gain.
@@ -115,6 +281,14 @@ def calculate_ff_coef(step, num_steps, sigmoid_steepness, sigmoid_shift, sigmoid
     return (-np.exp(-safe_sigmoid) + 1) * sigmoid_height
 
 
+def ff_coef_schedule(num_steps, sigmoid_steepness, sigmoid_shift, sigmoid_height=1):
+    """
+    Tabulate calculate_ff_coef for every step of a simulation run.
+    """
+    return np.array([calculate_ff_coef(step, num_steps, sigmoid_steepness, sigmoid_shift, sigmoid_height)
+                     for step in range(num_steps)], dtype=float)
+
+
 def bounding_box(gc_pos, gc_size, substrate):
     """
     Calculate the boundaries of the bounding box for a growth cone (used in fiber-target interaction).
@@ -128,6 +302,33 @@ def bounding_box(gc_pos, gc_size, substrate):
     return x_min, x_max, y_min, y_max
 
 
+def footprint_offsets(gc_size):
+    """
+    List the (row, col) offsets of all substrate cells covered by a growth cone whose bounding box is not cut off
+    by the substrate border, in the order ft_interaction_direct visits them.
+    """
+    in_circle = geometry_table(gc_size).in_circle
+    return [(di, dj)
+            for di in range(-gc_size, gc_size)
+            for dj in range(-gc_size, gc_size)
+            if in_circle[di * di + dj * dj]]
+
+
+@lru_cache(maxsize=None)
+def geometry_table(radius):
+    """
+    Tabulate distance, overlap area and in-circle test for growth cones of a radius, indexed by the squared integer
+    offset between two positions. Covers all offsets closer than radius * 2, i.e. within fiber-fiber interaction
+    range. Entries are computed by the same code as euclidean_distance and intersection_area, so lookups are
+    bit-identical to computing them from scratch.
+    """
+    in_range = 4 * radius * radius
+    distance = [math.sqrt(d_squared) for d_squared in range(in_range)]
+    area = [overlap_area(d, radius) for d in distance]
+    in_circle = [d_squared <= radius * radius for d_squared in range(in_range)]
+    return GeometryTable(distance, area, in_circle)
+
+
 def euclidean_distance(point1, point2):
     """
     Calculate the Euclidean distance between two points in a 2-dimensional space.
@@ -142,7 +343,13 @@ def intersection_area(gc1_pos, gc2_pos, radius):
     Calculate the area of intersection between two circles (circumscribed around growth cones).
     """
     d = euclidean_distance(gc1_pos, gc2_pos)  # Distance between the centers of the circles
+    return overlap_area(d, radius)
+
 
+def overlap_area(d, radius):
+    """
+    Calculate the area of intersection between two circles of a radius whose centers are d apart.
+    """
     if d == 0:
         # Total overlap
         return radius * radius * math.pi
@@ -0,0 +1,48 @@
+"""
+Module providing the numeric precision policies applied to growth cone state and guidance potentials.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from build import config
+
+# Quantization applied to every stored value, and the dtype of the arrays storing quantized values: the histories,
+# the adaptation windows of the array engines and the initial signal values
+PrecisionPolicy = namedtuple("PrecisionPolicy", ["name", "quantize", "dtype"])
+
+
+def quantize_legacy(value):
+    """
+    Round to 6 decimals. Equivalent to the original float("{:.6f}".format(value)), as both round the exact binary
+    value correctly, but without the string round trip.
+    """
+    return round(float(value), 6)
+
+
+def quantize_float64(value):
+    """
+    Keep full double precision.
+    """
+    return value
+
+
+def quantize_float32(value):
+    """
+    Round to the nearest single precision value.
+    """
+    return float(np.float32(value))
+
+
+def get_precision_policy(name):
+    """
+    Return the precision policy for a configured precision mode.
+    """
+    if name == config.PRECISION_LEGACY:
+        return PrecisionPolicy(name, quantize_legacy, np.float64)
+    if name == config.PRECISION_FLOAT64:
+        return PrecisionPolicy(name, quantize_float64, np.float64)
+    if name == config.PRECISION_FLOAT32:
+        return PrecisionPolicy(name, quantize_float32, np.float32)
+    raise ValueError("Precision unknown")
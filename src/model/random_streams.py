@@ -0,0 +1,70 @@
+"""
+Module providing the RandomStreams class, reproducible per growth cone random numbers.
+"""
+
+import numpy as np
+
+# Random numbers per growth cone and step: x direction, y direction and step decision
+DRAWS = 3
+
+# Steps drawn at once per growth cone
+BLOCK_STEPS = 1024
+
+
+class RandomStreams:
+    """
+    Gives every growth cone its own random number generator, derived from one seed by a SeedSequence, and lays out
+    its numbers by step: step t of growth cone i always gets the same DRAWS numbers, however many steps it skipped
+    or in which order growth cones are processed. Numbers are drawn BLOCK_STEPS steps ahead.
+
+    Attributes:
+        generators (list): Generator of every growth cone, by index in the simulation's growth cone list.
+        blocks (list): Numbers of the current block of every growth cone, indexed by step and draw.
+        block_firsts (list): First step of the current block of every growth cone.
+    """
+
+    def __init__(self, seed, count, block_steps=BLOCK_STEPS):
+        """
+        Initializes the RandomStreams.
+
+        :param seed: Seed of the simulation, an int or a sequence of ints.
+        :param count: Number of growth cones.
+        """
+        self.block_steps = block_steps
+        self.generators = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(count)]
+        self.blocks = [None] * count
+        self.block_firsts = [-block_steps] * count
+
+    def block(self, i, step):
+        """
+        Return the block of growth cone i containing a step, drawing ahead as needed.
+        """
+        first = step - step % self.block_steps
+        if first < self.block_firsts[i]:
+            raise ValueError("Random streams cannot rewind")
+        while self.block_firsts[i] < first:
+            self.blocks[i] = self.generators[i].random((self.block_steps, DRAWS))
+            self.block_firsts[i] += self.block_steps
+        return self.blocks[i]
+
+    def step_uniforms(self, i, step):
+        """
+        Return the random numbers of growth cone i for a step.
+        """
+        return self.block(i, step)[step % self.block_steps].tolist()
+
+    def uniforms(self, indexes, step_first, steps):
+        """
+        Return the random numbers of several growth cones for a range of steps.
+
+        :return: Array indexed by step, growth cone and draw.
+        """
+        result = np.empty((steps, len(indexes), DRAWS))
+        step = step_first
+        while step < step_first + steps:
+            offset = step % self.block_steps
+            count = min(self.block_steps - offset, step_first + steps - step)
+            for a, i in enumerate(indexes):
+                result[step - step_first:step - step_first + count, a] = self.block(i, step)[offset:offset + count]
+            step += count
+        return result
@@ -0,0 +1,305 @@
+"""
+Module providing the ReplicaSimulation class, which advances independent replicas of one configuration in lockstep.
+"""
+
+import math
+import random
+import time
+
+import numpy as np
+
+from build import config
+from model import simulation
+from model.array_simulation import (BLOCK_STEPS, GrowthConeArrays, allocate_records, choose_directions,
+                                    unpack_records)
+from model.potential_calculation import (ff_coef_schedule, ft_interaction_direct, geometry_table, guidance_signals,
+                                         signal_potential)
+from model.result import Result
+
+# Per growth cone state of GrowthConeArrays, stacked across replicas
+FIELDS = ("xs", "ys", "sizes", "ligands", "receptors", "potentials", "adap_cos", "reset_ligands", "reset_receptors",
+          "start_ligands", "start_receptors", "frozen", "windows", "window_counts")
+
+
+class ReplicaSimulation(simulation.Simulation):
+    """
+    Runs R replicas of one configuration, differing only in their random numbers, in a single process. The state
+    of all replicas is held in arrays shaped (R, N), so every operation of the sequential sweep is done for a
+    growth cone in all replicas at once and the interpreter overhead of a step is paid once instead of R times. The
+    substrate and its footprint fields are shared by all replicas.
+
+    Every replica draws from the random streams of its own seed, so it follows the trajectory of a single run of
+    the array engine with that seed. Replicas without a seed draw from the random module.
+
+    Attributes:
+        replicas (list): Growth cone list of every replica.
+        seeds (list): Seed of every replica.
+        streams (list): Random streams of every replica, None for replicas without a seed.
+        arrays (ReplicaArrays): State of all replicas during the iteration.
+        ff_coefs (np.ndarray): Fiber-fiber coefficient for every step.
+    """
+
+    def __init__(self, substrate, replicas, *args, seeds=None, **kwargs):
+        super().__init__(substrate, replicas[0], *args, **kwargs)
+        if self.ff_mode != config.FF_PAIRWISE:
+            raise ValueError("Replicas require pairwise fiber-fiber interaction")
+        if self.adaptation and self.history_length < 1:
+            raise ValueError("Replicas require an adaptation history of at least one step")
+        self.replicas = replicas
+        self.seeds = list(seeds) if seeds is not None else [None] * len(replicas)
+        self.streams = []
+        self.arrays = None
+        self.ff_coefs = None
+
+    def run(self):
+        """
+        Runs all replicas.
+
+        :return: List with the Result of every replica.
+        """
+        start_time = time.time()
+
+        self.streams = []
+        stores = []
+        for replica, seed in zip(self.replicas, self.seeds):
+            self.growth_cones = replica
+            self.seed = seed
+            self.prepare_gcs()
+            self.streams.append(self.random_streams)
+            stores.append(self.history_store)
+        self.growth_cones = self.replicas[0]
+        print(f"\nInitialization of {len(self.replicas)} replicas completed.\n")
+
+        print(f"\nIteration starts, {self.num_steps} many steps will be taken\n")
+        self.iterate_simulation()
+
+        total_time = time.time() - start_time
+        print(f"\nIteration completed in {total_time:.2f} seconds\n")
+
+        for store in stores:
+            if store is not None:
+                store.close()
+
+        return [Result(replica, self.substrate, self.num_steps, run_config=self.replica_config(seed),
+                       history_store=store)
+                for replica, seed, store in zip(self.replicas, self.seeds, stores)]
+
+    def replica_config(self, seed):
+        """
+        Return the configuration of a single array engine run following the replica of a seed, None if the
+        simulation was not built from a configuration.
+        """
+        if self.run_config is None:
+            return None
+        return dict(self.run_config, **{config.SEED: seed, config.ENGINE: config.ENGINE_ARRAY})
+
+    def iterate_simulation(self):
+        replicas = self.replicas
+        self.arrays = ReplicaArrays(replicas, max(1, self.history_length), self.precision.dtype)
+        self.ff_coefs = ff_coef_schedule(self.num_steps, self.sigmoid_steepness, self.sigmoid_shift)
+        if (self.arrays.frozen != self.arrays.frozen[0]).any():
+            raise ValueError("Replicas must freeze the same growth cones")
+        active = np.flatnonzero(~self.arrays.frozen[0])
+        draws = 2 if self.force else 3
+        count = len(replicas[0])
+
+        for step_first in range(0, self.num_steps, BLOCK_STEPS):
+            steps = min(BLOCK_STEPS, self.num_steps - step_first)
+            print(f"Current Step: {step_first}")
+            simulation.progress = int((step_first / self.num_steps) * 100)
+
+            uniforms = np.empty((steps, len(replicas), len(active), draws))
+            for r, streams in enumerate(self.streams):
+                if streams is None:
+                    drawn = [random.random() for _ in range(steps * len(active) * draws)]
+                    uniforms[:, r] = np.array(drawn, dtype=float).reshape(steps, len(active), draws)
+                else:
+                    uniforms[:, r] = streams.uniforms(active, step_first, steps)[..., :draws]
+
+            records = [record.reshape((steps, len(replicas), count) + record.shape[2:])
+                       for record in allocate_records(steps, len(replicas) * count)]
+            self.run_block(step_first, uniforms, active, records)
+            for r, replica in enumerate(replicas):
+                unpack_records(replica, [record[:, r] for record in records], self.adaptation)
+
+        for replica, packed in zip(replicas, self.arrays.replicas):
+            packed.write_back(replica)
+            self.growth_cones = replica
+            self.build_ff_index()
+        self.growth_cones = replicas[0]
+        simulation.progress = 100
+
+    def run_block(self, step_first, uniforms, active, records):
+        """
+        Run a block of steps in all replicas, like ArraySimulation.run_block with a replica axis in front.
+
+        :param uniforms: Random numbers of the block, indexed by step, replica, active growth cone and draw.
+        """
+        rec_accepted, rec_positions, rec_potentials = records[:3]
+        arrays = self.arrays
+        quantize = self.precision.quantize
+        replicas = range(len(self.replicas))
+        # Out of range offsets are clipped onto a trailing zero area
+        areas = {size: np.append(geometry_table(size).area, 0.0) for size in set(arrays.sizes[0, active].tolist())}
+
+        for step in range(uniforms.shape[0]):
+            ff_coef = self.ff_coefs[step_first + step] if self.ff_inter else 0
+            if self.adaptation:
+                ligands_new, receptors_new = self.adapt_block(active, records, step)
+            xs_new, ys_new = self.propose_block(uniforms[step], active)
+            ft_ligands, ft_receptors = self.ft_block(active, xs_new, ys_new)
+
+            for a, i in enumerate(active.tolist()):
+                if self.adaptation:
+                    arrays.ligands[:, i] = ligands_new[:, a]
+                    arrays.receptors[:, i] = receptors_new[:, a]
+                ligands = arrays.ligands[:, i]
+                receptors = arrays.receptors[:, i]
+                x, y = xs_new[:, a], ys_new[:, a]
+
+                ff_ligands = ff_receptors = 0
+                if self.ff_inter:
+                    ff_ligands, ff_receptors = self.ff_sums(i, x, y, areas[arrays.sizes[0, i]])
+
+                forward_sigs, reverse_sigs = guidance_signals(ligands, receptors, ft_ligands[:, a], ft_receptors[:, a],
+                                                              ff_ligands, ff_receptors, ff_coef, self.forward_sig,
+                                                              self.reverse_sig, np.zeros(len(replicas)))
+                potentials_new = np.array([signal_potential(forward, reverse, quantize) for forward, reverse
+                                           in zip(forward_sigs.tolist(), reverse_sigs.tolist())], dtype=float)
+
+                take = np.ones(len(replicas), dtype=np.bool_)
+                if not self.force:
+                    probabilities = [simulation.calculate_step_probability(self.density(old), self.density(new))
+                                     for old, new in zip(arrays.potentials[:, i].tolist(), potentials_new.tolist())]
+                    take = uniforms[step, :, a, 2] > np.array(probabilities, dtype=float)
+
+                taken = np.flatnonzero(take)
+                arrays.xs[taken, i] = x[taken]
+                arrays.ys[taken, i] = y[taken]
+                arrays.potentials[taken, i] = potentials_new[taken]
+                arrays.windows[taken, i, arrays.window_counts[taken, i] % arrays.windows.shape[2]] = \
+                    potentials_new[taken]
+                arrays.window_counts[taken, i] += 1
+                rec_accepted[step, taken, i] = True
+                rec_positions[step, taken, i, 0] = x[taken]
+                rec_positions[step, taken, i, 1] = y[taken]
+                rec_potentials[step, taken, i] = potentials_new[taken]
+
+    def adapt_block(self, active, records, step):
+        """
+        Calculate the adaptation of all active growth cones in all replicas, see ArraySimulation.adapt_block.
+        """
+        arrays = self.arrays
+        quantize = self.precision.quantize
+        h = self.history_length
+
+        counts = arrays.window_counts[:, active]
+        slots = (counts[..., np.newaxis] - h + np.arange(h)) % arrays.windows.shape[2]
+        window = np.take_along_axis(arrays.windows[:, active], slots, axis=2)
+        ready = counts >= h
+        if ready.any():
+            weighted = np.cumsum(np.arange(1, h + 1) * np.abs(window[ready]), axis=1)[:, -1]
+            log_args = 1 + self.mu * weighted / sum(range(1, h + 1))
+            adap_cos = arrays.adap_cos[:, active]
+            adap_cos[ready] = [quantize(1 + math.log(arg)) for arg in log_args.tolist()]
+            arrays.adap_cos[:, active] = adap_cos
+            for name, starts, values in (("reset_receptors", arrays.start_receptors, arrays.receptors),
+                                         ("reset_ligands", arrays.start_ligands, arrays.ligands)):
+                resets = getattr(arrays, name)[:, active]
+                resets[ready] = self.lambda_ * (starts[:, active][ready] - values[:, active][ready])
+                getattr(arrays, name)[:, active] = resets
+
+        adap_cos = arrays.adap_cos[:, active]
+        ligands = np.maximum(0, arrays.ligands[:, active] * adap_cos + arrays.reset_ligands[:, active])
+        receptors = np.maximum(0, arrays.receptors[:, active] * adap_cos + arrays.reset_receptors[:, active])
+        ligands = np.array([quantize(value) for value in ligands.ravel().tolist()], dtype=float).reshape(ligands.shape)
+        receptors = np.array([quantize(value) for value in receptors.ravel().tolist()],
+                             dtype=float).reshape(receptors.shape)
+
+        _, _, _, rec_adap_cos, rec_ligands, rec_receptors, rec_reset_ligands, rec_reset_receptors = records
+        rec_adap_cos[step][:, active] = adap_cos
+        rec_ligands[step][:, active] = ligands
+        rec_receptors[step][:, active] = receptors
+        rec_reset_ligands[step][:, active] = arrays.reset_ligands[:, active]
+        rec_reset_receptors[step][:, active] = arrays.reset_receptors[:, active]
+        return ligands, receptors
+
+    def propose_block(self, uniforms, active):
+        """
+        Generate the random steps of all active growth cones in all replicas, see gen_random_step.
+        """
+        x_prob = self.x_step_p
+        y_prob = self.y_step_p
+        xt_directions = choose_directions(uniforms[..., 0], (1 - x_prob), (1 - x_prob), x_prob)
+        yt_directions = choose_directions(uniforms[..., 1], y_prob, (1 - y_prob), y_prob)
+
+        sizes = self.arrays.sizes[:, active]
+        xs_new = self.arrays.xs[:, active] + xt_directions * self.step_size
+        ys_new = self.arrays.ys[:, active] + yt_directions * self.step_size
+        xs_new = np.maximum(sizes, np.minimum(xs_new, self.substrate.cols - 1 - sizes))
+        ys_new = np.maximum(sizes, np.minimum(ys_new, self.substrate.rows - 1 - sizes))
+        return xs_new, ys_new
+
+    def ft_block(self, active, xs_new, ys_new):
+        """
+        Calculate the fiber-target sums of all active growth cones in all replicas at their proposals, see
+        ft_interaction.
+        """
+        sum_ligands = np.zeros(xs_new.shape)
+        sum_receptors = np.zeros(xs_new.shape)
+        if not self.ft_inter:
+            return sum_ligands, sum_receptors
+
+        sizes = self.arrays.sizes[:, active]
+        for size in set(sizes.ravel().tolist()):
+            covered = ((sizes == size) & (xs_new >= size) & (xs_new < self.substrate.cols - size)
+                       & (ys_new >= size) & (ys_new < self.substrate.rows - size))
+            ligand_field, receptor_field = self.substrate.get_footprint_fields(size)
+            sum_ligands[covered] = ligand_field[ys_new[covered], xs_new[covered]]
+            sum_receptors[covered] = receptor_field[ys_new[covered], xs_new[covered]]
+
+            for r, a in zip(*np.nonzero((sizes == size) & ~covered)):
+                gc = self.replicas[r][active[a]]
+                sum_ligands[r, a], sum_receptors[r, a] = ft_interaction_direct(gc, (xs_new[r, a], ys_new[r, a]),
+                                                                               self.substrate)
+
+        return sum_ligands, sum_receptors
+
+    def ff_sums(self, i, xs, ys, areas):
+        """
+        Calculate the fiber-fiber sums of growth cone i in all replicas at a position each, see ff_interaction.
+
+        :param areas: Overlap areas by squared offset, followed by a zero area for all offsets out of range.
+        """
+        arrays = self.arrays
+        dx = arrays.xs - xs[:, np.newaxis]
+        dy = arrays.ys - ys[:, np.newaxis]
+        area = areas[np.minimum(dx * dx + dy * dy, len(areas) - 1)]
+        area[:, i] = 0
+
+        # Cumulative sums add the contributions in list order, exactly like ff_interaction
+        return (np.cumsum(area * arrays.ligands, axis=1)[:, -1],
+                np.cumsum(area * arrays.receptors, axis=1)[:, -1])
+
+    def density(self, potential):
+        """
+        Compute probabilistic_density with the sigma of this simulation.
+        """
+        return simulation.probabilistic_density(potential, self.sigma)
+
+
+class ReplicaArrays:
+    """
+    The fields of GrowthConeArrays stacked across replicas, shaped (R, N) or (R, N, window length).
+
+    Attributes:
+        replicas (list): GrowthConeArrays of every replica, whose arrays are views into the stacked arrays.
+    """
+
+    def __init__(self, replicas, window_length, dtype=float):
+        self.replicas = [GrowthConeArrays(gcs, window_length, dtype) for gcs in replicas]
+        for name in FIELDS:
+            stacked = np.stack([getattr(packed, name) for packed in self.replicas])
+            setattr(self, name, stacked)
+            for r, packed in enumerate(self.replicas):
+                setattr(packed, name, stacked[r])
@@ -2,16 +2,59 @@
 Module providing Result class for result representation.
 """
 
+import contextlib
+import io
+
 import numpy as np
 
+from build import config as cfg
+from model.convergence import STOP_STEP_LIMIT
+
 
 class Result:
-    def __init__(self, gcs, substrate):
+    def __init__(self, gcs, substrate, stop_step=None, stop_reason=STOP_STEP_LIMIT, run_config=None,
+                 history_store=None):
         """
         Initializes a Result object
+
+        :param stop_step: Number of steps the simulation took before it stopped.
+        :param stop_reason: Why the simulation stopped, see model.convergence.
+        :param run_config: Configuration the run was built from, None if unknown.
+        :param history_store: Store the histories were streamed to, None if they were recorded in memory. The
+            histories of the growth cones read from it as memory maps.
         """
         self.gcs = gcs
         self.frame = substrate.rows, substrate.cols
+        self.stop_step = stop_step
+        self.stop_reason = stop_reason
+        self.run_config = run_config
+        self.history_store = history_store
+
+    def replay(self, gc_ids=None):
+        """
+        Re-run the simulation from its configuration and seed, recording the full history of the requested growth
+        cones only. The seeded random streams make the replay take the same steps, which is checked against the
+        final positions of this result.
+
+        :param gc_ids: Ids of the growth cones to record, None for all of them.
+        :return: Result of the replay, its growth cones carry the recorded histories.
+        """
+        # Imported here, as the factory builds the simulations that create results
+        from build import object_factory
+
+        if self.run_config is None or self.run_config.get(cfg.SEED) is None:
+            raise ValueError("Replay requires a result of a seeded run built from a configuration")
+        replay_config = dict(self.run_config)
+        # Histories of the replay stay in memory, streaming would write another run directory of history files
+        replay_config.update({cfg.HISTORY_LEVEL: cfg.HISTORY_FULL, cfg.HISTORY_GC_IDS: gc_ids,
+                              cfg.HISTORY_DIRECTORY: None})
+        simulation = object_factory.build_simulation(replay_config)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = simulation.run()
+
+        if [tuple(gc.pos) for gc in result.gcs] != [tuple(gc.pos) for gc in self.gcs]:
+            raise ValueError("Replay diverged from the stored final positions")
+        return result
 
     def get_mapping(self):
         # TODO: @Clean Make a unified projection mapping by automatically dividing between position or id number
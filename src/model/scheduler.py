@@ -0,0 +1,151 @@
+"""
+Module providing the ActivityScheduler class, which picks the growth cones visited in a simulation step by their
+recent activity.
+"""
+
+import math
+import random
+from collections import deque
+
+import numpy as np
+
+from build import config
+
+# Visits of a growth cone its activity is measured over
+WINDOW = 50
+
+# Smallest share of steps every growth cone is visited in
+MIN_RATE = 0.1
+
+# Spawn key of the scheduler's random stream, beyond those of the growth cone streams
+SPAWN_KEY = 2 ** 32
+
+
+class ActivityScheduler:
+    """
+    Visits every growth cone with a probability proportional to its activity, relative to the most active growth
+    cone, so settled growth cones are proposed fewer steps. Activity is measured over the last WINDOW visits from
+    the growth cone history: either the share of visits with an accepted step (SCHEDULER_MOVEMENT), or the variance
+    of the potentials reached by those steps (SCHEDULER_VARIANCE). Growth cones with fewer visits than the window
+    are always visited. Every growth cone is visited with at least the minimum rate, and at the latest
+    1 / min_rate steps after its last visit.
+
+    A growth cone that is not visited neither adapts nor proposes a step in that step, so it runs on its own,
+    slower clock. The visit statistics show how far the clocks drift apart.
+
+    Attributes:
+        measure (str): Activity measure, see config.
+        window (int): Visits the activity is measured over.
+        min_rate (float): Smallest visit probability of a growth cone.
+        generator (np.random.Generator): Random numbers of the visits if the simulation is seeded, None to draw
+            from the random module.
+        steps (int): Steps scheduled since the last reset.
+        visits (np.ndarray): Visits of every growth cone since the last reset.
+        last_visits (np.ndarray): Step of the last visit of every growth cone.
+        moves (list): Whether each of the last window visits of every growth cone accepted a step.
+        activities (np.ndarray): Activity of every growth cone, updated after its visits.
+        counts (list): Length of the position history of every growth cone after its last visit.
+        visited (list): Growth cones visited in the previous step.
+    """
+
+    def __init__(self, measure, window=WINDOW, min_rate=MIN_RATE):
+        if measure not in (config.SCHEDULER_MOVEMENT, config.SCHEDULER_VARIANCE):
+            raise ValueError("Scheduler measure unknown")
+        if not 0 < min_rate <= 1:
+            raise ValueError("Scheduler minimum rate must lie in (0, 1]")
+        self.measure = measure
+        self.window = max(1, window)
+        self.min_rate = min_rate
+        self.generator = None
+        self.steps = 0
+        self.visits = np.zeros(0, dtype=np.int64)
+        self.last_visits = np.zeros(0, dtype=np.int64)
+        self.moves = []
+        self.activities = np.zeros(0, dtype=float)
+        self.counts = []
+        self.visited = []
+
+    def reset(self, gcs, seed=None):
+        """
+        Drop all statistics, e.g. before a new run.
+
+        :param gcs: Growth cones of the simulation.
+        :param seed: Seed of the simulation, None to draw from the random module.
+        """
+        self.generator = None
+        if seed is not None:
+            self.generator = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(SPAWN_KEY,)))
+        self.steps = 0
+        self.visits = np.zeros(len(gcs), dtype=np.int64)
+        self.last_visits = np.full(len(gcs), -1, dtype=np.int64)
+        self.moves = [deque(maxlen=self.window) for _ in gcs]
+        self.activities = np.zeros(len(gcs), dtype=float)
+        self.counts = [gc.history.count("position") for gc in gcs]
+        self.visited = []
+
+    def select(self, gcs, active, step):
+        """
+        Choose the growth cones to visit in a step.
+
+        :param gcs: Growth cones of the simulation.
+        :param active: Indexes of the growth cones that are not frozen, in list order.
+        :param step: Current step.
+        :return: Indexes of the growth cones to visit, in list order.
+        """
+        # Activities only change with the visits of the previous step
+        for rank in self.visited:
+            count = gcs[rank].history.count("position")
+            self.moves[rank].append(count > self.counts[rank])
+            self.counts[rank] = count
+            self.activities[rank] = self.activity(gcs[rank], self.moves[rank])
+
+        active = np.asarray(active, dtype=np.int64)
+        if self.generator is None:
+            uniforms = np.array([random.random() for _ in range(len(active))], dtype=float)
+        else:
+            uniforms = self.generator.random(len(active))
+
+        activities = self.activities[active]
+        highest = activities.max(initial=0.0)
+        rates = np.full(len(active), self.min_rate)
+        if highest > 0:
+            rates = np.maximum(self.min_rate, activities / highest)
+        warming_up = np.array([len(self.moves[rank]) < self.window for rank in active.tolist()], dtype=np.bool_)
+        overdue = step - self.last_visits[active] >= math.ceil(1 / self.min_rate)
+        selected = active[warming_up | overdue | (uniforms < rates)]
+
+        self.steps += 1
+        self.visits[selected] += 1
+        self.last_visits[selected] = step
+        self.visited = selected.tolist()
+        return self.visited
+
+    def activity(self, gc, moves):
+        """
+        Measure the activity of a growth cone over its last visits.
+        """
+        if not moves:
+            return 0.0
+        accepted = sum(moves)
+        if self.measure == config.SCHEDULER_MOVEMENT:
+            return accepted / len(moves)
+        if accepted < 2:
+            return 0.0
+        return float(np.var(gc.history.latest("potential", accepted)))
+
+    def visit_rates(self):
+        """
+        Return the share of scheduled steps every growth cone was visited in.
+        """
+        return self.visits / max(1, self.steps)
+
+    def summary(self, active):
+        """
+        Summarize the visit rates of the growth cones that are not frozen.
+
+        :return: Tuple of the mean, lowest and highest visit rate.
+        """
+        rates = self.visit_rates()[active]
+        if not len(rates):
+            return 0.0, 0.0, 0.0
+        return float(rates.mean()), float(rates.min()), float(rates.max())
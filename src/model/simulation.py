@@ -1,12 +1,24 @@
 """
 Main module which executes simulation logic
 """
+import bisect
+import itertools
 import math
 import time
+from model.cell_list import CellList
+from model.convergence import STOP_CONVERGED, STOP_STEP_LIMIT
 from model.result import Result
-from model.potential_calculation import calculate_potential
+from model.backends import get_backend
+from model.potential_calculation import calculate_ff_coef, calculate_potentials_batch, geometry_table
 import random
 
+from build import config
+from model.neighbour_sums import NeighbourSums
+from model.fiber_density import FiberDensityField
+from model.history_store import HistoryStore
+from model.precision import get_precision_policy
+from model.random_streams import RandomStreams
+
 progress = 0  # Global progress variable
 
 
@@ -38,11 +50,38 @@ class Simulation:
         mu (float): Adjusting parameter for the adaptation coefficient.
         lambda_ (float): Adjusting parameter for the resetting force.
         history_length (int): The number of historical steps to consider for adaptation.
+        ff_mode (str): Fiber-fiber interaction mode, pairwise over neighbours or read from a fiber density field.
+        precision (PrecisionPolicy): Quantization applied to guidance potentials.
+        backend (Backend): Implementation of the potential calculation.
+        seed (int): Seed of the per growth cone random streams. Without a seed, random numbers are drawn from the
+            global random module.
+        convergence (ConvergenceMonitor): Stops the iteration early once the run has converged, None to always
+            take all steps.
+        stop_step (int): Number of steps taken by the last run.
+        stop_reason (str): Why the last run stopped, see model.convergence.
+        scheduler (ActivityScheduler): Picks the growth cones visited in every step, None to visit all of them.
+        history_level (str): Which entries the growth cone histories record, see config.
+        history_interval (int): Every how many entries one is recorded at HISTORY_EVERY.
+        trajectory_encoding (str): Storage of the recorded positions, see config.
+        history_gc_ids (set): Ids of the growth cones recorded at history_level, the others record nothing. None to
+            record all of them.
+        history_directory (str): Directory the histories of every run are streamed to, in a new run directory below
+            it. None to record them in memory.
+        history_chunk (int): Entries per chunk written to the history directory.
+        history_store (HistoryStore): Store of the histories of the last run, None if recorded in memory.
+        run_config (dict): Configuration the simulation was built from, None if it was built directly. Lets a result
+            be replayed.
+        active (list): Indexes of the growth cones that are not frozen, the only ones iterated.
+        static_field (FiberDensityField): Deposits of the frozen growth cones leading the list, folded once for
+            pairwise fiber-fiber interaction, None if there are none.
     """
 
     def __init__(self, substrate, growth_cones, adaptation, step_size, num_steps, x_step_p, y_step_p, sigmoid_steepness,
                  sigmoid_shift, sigma, force, forward_sig, reverse_sig, ff_inter, ft_inter, mu, lambda_,
-                 history_length):
+                 history_length, ff_mode=config.FF_PAIRWISE, precision=None, backend=None, seed=None,
+                 convergence=None, scheduler=None, history_level=config.HISTORY_FULL, history_interval=1,
+                 trajectory_encoding=config.TRAJECTORY_PLAIN, history_gc_ids=None, history_directory=None,
+                 history_chunk=4096):
         """
         Initialize the Simulation class with necessary parameters explained above.
         """
@@ -64,6 +103,32 @@ class Simulation:
         self.mu = mu
         self.lambda_ = lambda_
         self.history_length = history_length
+        self.ff_mode = ff_mode
+        self.precision = precision or get_precision_policy(config.PRECISION_LEGACY)
+        self.backend = backend or get_backend(config.BACKEND_PYTHON)
+        self.seed = seed
+        self.random_streams = None
+        self.convergence = convergence
+        self.stop_step = num_steps
+        self.stop_reason = STOP_STEP_LIMIT
+        self.scheduler = scheduler
+        self.history_level = history_level
+        self.history_interval = history_interval
+        self.trajectory_encoding = trajectory_encoding
+        self.history_gc_ids = set(history_gc_ids) if history_gc_ids is not None else None
+        self.history_directory = history_directory
+        self.history_chunk = history_chunk
+        self.history_store = None
+        self.run_config = None
+        self.cell_list = None
+        self.ff_field = None
+        self.neighbour_sums = None
+        self.static_field = None
+        self.active = []
+
+        # Build the geometry lookup tables once, all potential calculations share them
+        for gc in growth_cones:
+            geometry_table(gc.size)
 
     def run(self):
         """
@@ -85,7 +150,19 @@ class Simulation:
         """
 
         print(f"\nIteration starts, {self.num_steps} many steps will be taken\n")
+        self.stop_step = self.num_steps
+        self.stop_reason = STOP_STEP_LIMIT
+        if self.convergence is not None:
+            self.convergence.reset()
+        if self.scheduler is not None:
+            self.scheduler.reset(self.growth_cones, self.seed)
         self.iterate_simulation()
+        if self.stop_reason == STOP_CONVERGED:
+            print(f"\nConverged after {self.stop_step} steps\n")
+        if self.scheduler is not None:
+            mean_rate, lowest_rate, highest_rate = self.scheduler.summary(self.active)
+            print(f"\nScheduler visit rates: mean {mean_rate:.2f}, lowest {lowest_rate:.2f}, "
+                  f"highest {highest_rate:.2f}\n")
 
         end_time = time.time()  # End timing the model
         total_time = end_time - start_time
@@ -94,17 +171,74 @@ class Simulation:
         for gc in self.growth_cones:
             print(gc)
 
-        return Result(self.growth_cones, self.substrate)
+        if self.history_store is not None:
+            self.history_store.close()
+
+        return Result(self.growth_cones, self.substrate, self.stop_step, self.stop_reason, self.run_config,
+                      self.history_store)
 
     def prepare_gcs(self):
         """
-        Initializes the potential values for each growth cone.
+        Builds the fiber-fiber index, the active index list and the random streams, sets up the histories of the
+        moving growth cones, and initializes the potential values for each growth cone.
         """
+        self.build_ff_index()
+        self.active = [rank for rank, gc in enumerate(self.growth_cones) if not gc.freeze]
+        # Adaptation and the scheduler read the latest potentials, which are kept at every recording level
+        keep = max(1, self.history_length, self.scheduler.window if self.scheduler is not None else 0)
+        for rank in self.active:
+            gc = self.growth_cones[rank]
+            recorded = self.history_gc_ids is None or gc.id in self.history_gc_ids
+            gc.history.configure(self.history_level if recorded else config.HISTORY_NONE, self.history_interval,
+                                 keep, self.trajectory_encoding, self.step_size)
+            gc.history.reserve(self.num_steps, self.adaptation)
+        self.history_store = None
+        if self.history_directory is not None:
+            self.history_store = HistoryStore.for_run(self.history_directory,
+                                                      [gc.history for gc in self.growth_cones], self.num_steps,
+                                                      self.history_chunk)
+            for rank in self.active:
+                self.growth_cones[rank].history.stream(self.history_store, rank)
+        if self.seed is not None:
+            self.random_streams = RandomStreams(self.seed, len(self.growth_cones))
+
         for gc in self.growth_cones:
+            # Frozen growth cones are part of the static field, which cannot leave out their own deposit
+            ff_source = None if gc.freeze and self.static_field is not None else self.ff_source()
             # Potential initialization
-            gc.potential = calculate_potential(gc, gc.pos, self.growth_cones, self.substrate, self.forward_sig,
-                                               self.reverse_sig, self.ff_inter, self.ft_inter, 0,
-                                               self.num_steps, self.sigmoid_steepness, self.sigmoid_shift)
+            gc.potential = self.backend.calculate_potential(gc, gc.pos, self.growth_cones, self.substrate,
+                                                            self.forward_sig, self.reverse_sig, self.ff_inter,
+                                                            self.ft_inter, 0, self.num_steps, self.sigmoid_steepness,
+                                                            self.sigmoid_shift, ff_source, self.precision.quantize)
+
+    def build_ff_index(self):
+        """
+        Builds the fiber-fiber index for the current growth cone positions and registers it with the growth cones.
+
+        For pairwise interaction, the frozen growth cones leading the list are folded into a static field once and
+        left out of the cell list. A neighbour scan adds the growth cones in list order, so starting it from the
+        static sums keeps the sums bit-identical. Frozen growth cones after a moving one stay in the cell list, as
+        do all growth cones if their sizes differ, since the field holds the overlap kernel of a single size.
+        """
+        gcs = self.growth_cones
+        gc_size = max((gc.size for gc in gcs), default=0)
+        self.static_field = None
+        if self.ff_mode == config.FF_MESH:
+            self.cell_list = self.neighbour_sums = None
+            self.ff_field = FiberDensityField(self.substrate, gcs, gc_size)
+            trackers = [self.ff_field]
+        else:
+            frozen = next((k for k, gc in enumerate(gcs) if not gc.freeze), len(gcs))
+            if not self.ff_inter or any(gc.size != gc_size for gc in gcs):
+                frozen = 0
+            if frozen:
+                self.static_field = FiberDensityField(self.substrate, gcs[:frozen], gc_size)
+            self.cell_list = CellList(gcs[frozen:], gc_size)
+            self.neighbour_sums = NeighbourSums(self.cell_list, self.static_field)
+            self.ff_field = None
+            trackers = [self.cell_list]
+        for gc in gcs:
+            gc.trackers = list(trackers)
 
     def iterate_simulation(self):
         """
@@ -118,21 +252,103 @@ class Simulation:
                 progress = int((step_current / self.num_steps) * 100)
 
             # TODO: @Performance Parallelize with futures
-
-            for gc in self.growth_cones:
-                if not gc.freeze:  # Check if the growth cone is not frozen
-                    if self.adaptation:
-                        self.adapt_growth_cone(gc)
-                    pos_new = self.gen_random_step(gc)
-                    potential_new = calculate_potential(gc, pos_new, self.growth_cones, self.substrate,
-                                                        self.forward_sig, self.reverse_sig, self.ff_inter,
-                                                        self.ft_inter, step_current, self.num_steps,
-                                                        self.sigmoid_steepness, self.sigmoid_shift)
-                    self.step_decision(gc, pos_new, potential_new)
+            # Threads give no speedup, as evaluating proposals holds the GIL, and processes would need the state
+            # of every growth cone each step. Both must reproduce the trajectories of this sweep.
+
+            ranks = self.active
+            if self.scheduler is not None:
+                ranks = self.scheduler.select(self.growth_cones, self.active, step_current)
+
+            for rank in ranks:
+                gc = self.growth_cones[rank]
+                uniforms = self.step_uniforms(rank, step_current)
+                if self.adaptation:
+                    self.adapt_growth_cone(gc)
+                pos_new = self.gen_random_step(gc, uniforms)
+                potential_new = self.backend.calculate_potential(gc, pos_new, self.growth_cones, self.substrate,
+                                                                 self.forward_sig, self.reverse_sig, self.ff_inter,
+                                                                 self.ft_inter, step_current, self.num_steps,
+                                                                 self.sigmoid_steepness, self.sigmoid_shift,
+                                                                 self.ff_source(), self.precision.quantize)
+                self.step_decision(gc, pos_new, potential_new, uniforms)
+
+            if self.converged(step_current + 1):
+                break
 
         progress = 100
-        # TODO: @Performance Early stopping mechanism based on total potential
 
+    def converged(self, steps_taken):
+        """
+        Samples the convergence monitor every few steps and records the stop if the run has converged.
+
+        :param steps_taken: Number of steps taken so far.
+        :return: True if the iteration should stop.
+        """
+        if self.convergence is None or steps_taken % self.convergence.sample_steps:
+            return False
+        moving = [self.growth_cones[rank] for rank in self.active]
+        return self.record_convergence(steps_taken, [gc.pos[0] for gc in moving], [gc.pos[1] for gc in moving],
+                                       [gc.potential for gc in moving])
+
+    def record_convergence(self, steps_taken, xs, ys, potentials):
+        """
+        Passes a sample of the moving growth cones to the convergence monitor and records the stop if the run has
+        converged.
+        """
+        ff_coef = None
+        if self.ff_inter:
+            ff_coef = calculate_ff_coef(steps_taken - 1, self.num_steps, self.sigmoid_steepness, self.sigmoid_shift)
+        if not self.convergence.sample(xs, ys, potentials, ff_coef):
+            return False
+        self.stop_step = steps_taken
+        self.stop_reason = STOP_CONVERGED
+        return True
+
+    def step_uniforms(self, rank, step):
+        """
+        Returns the random numbers of a growth cone for a step from its random stream, or None without a seed.
+        """
+        if self.random_streams is None:
+            return None
+        return self.random_streams.step_uniforms(rank, step)
+
+    def ff_source(self):
+        """
+        Returns the provider of fiber-fiber sums for potential calculations.
+        """
+        return self.ff_field if self.ff_field is not None else self.neighbour_sums
+
+    def neighbours(self, pos, reach=0):
+        """
+        Returns the growth cones that can be in fiber-fiber interaction range of a position, or of any position
+        within reach of it.
+        """
+        if not self.ff_inter or self.cell_list is None:
+            return []
+        return self.cell_list.neighbours(pos, reach)
+
+    def candidate_steps(self, gc):
+        """
+        Returns all positions gen_random_step can propose for a growth cone, ordered by x and y direction.
+        """
+        return [clamp_to_boundaries(gc.pos, self.substrate, gc.size, xt_direction * self.step_size,
+                                    yt_direction * self.step_size)
+                for xt_direction in (-1, 0, 1) for yt_direction in (-1, 0, 1)]
+
+    def candidate_potentials(self, gc, step_current):
+        """
+        Evaluates the guidance potential of a growth cone at all its candidate steps in one batch.
+
+        :return: Tuple of the candidate positions and an array of their potentials.
+        """
+        positions = self.candidate_steps(gc)
+        # The batch scan cannot start from the static sums, which differ per position, so read them per position
+        ff_source = self.ff_field if self.static_field is None else self.neighbour_sums
+        potentials = calculate_potentials_batch(gc, positions, self.neighbours(gc.pos, self.step_size),
+                                                self.substrate, self.forward_sig, self.reverse_sig, self.ff_inter,
+                                                self.ft_inter, step_current, self.num_steps, self.sigmoid_steepness,
+                                                self.sigmoid_shift, ff_source, self.precision.quantize)
+        return positions, potentials
 
     def adapt_growth_cone(self, gc):
         """
@@ -141,9 +357,15 @@ class Simulation:
         gc.calculate_adaptation(self.mu, self.lambda_, self.history_length)
         gc.apply_adaptation()
 
-    def step_decision(self, gc, pos_new, potential_new):
+    def step_decision(self, gc, pos_new, potential_new, uniforms=None):
         """
         Decides whether the growth cone should step in the new position proposal based on its guidance potential
+
+        Proposals are accepted or rejected one by one. Drawing accepted moves directly (rejection-free, n-fold way)
+        does not pay off, as 25-45% of proposals are accepted even late in a run and rescheduling after every
+        move made it 4-6 times slower than this sweep.
+
+        :param uniforms: Random numbers of the growth cone for this step, see step_uniforms.
         """
         if self.force:
             # Force gc to take the random generated step, neglecting ques from guidance potential
@@ -156,13 +378,15 @@ class Simulation:
         probability = calculate_step_probability(old_density, new_density)
 
         # Step Decision
-        random_number = random.random()
+        random_number = random.random() if uniforms is None else uniforms[2]
         if random_number > probability:
             gc.take_step(pos_new, potential_new)
 
-    def gen_random_step(self, gc):
+    def gen_random_step(self, gc, uniforms=None):
         """
         Generates a random step for the growth cone based on predefined probabilities.
+
+        :param uniforms: Random numbers of the growth cone for this step, see step_uniforms.
         """
 
         # Initialization
@@ -170,8 +394,12 @@ class Simulation:
         y_prob = self.y_step_p
 
         # Randomly step in xt and yt directions -1, 0, +1
-        xt_direction = random.choices([-1, 0, 1], weights=[(1 - x_prob), (1 - x_prob), x_prob])[0]
-        yt_direction = random.choices([-1, 0, 1], weights=[y_prob, (1 - y_prob), y_prob])[0]
+        if uniforms is None:
+            xt_direction = random.choices([-1, 0, 1], weights=[(1 - x_prob), (1 - x_prob), x_prob])[0]
+            yt_direction = random.choices([-1, 0, 1], weights=[y_prob, (1 - y_prob), y_prob])[0]
+        else:
+            xt_direction = choose_direction(uniforms[0], [(1 - x_prob), (1 - x_prob), x_prob])
+            yt_direction = choose_direction(uniforms[1], [y_prob, (1 - y_prob), y_prob])
 
         xt_direction *= self.step_size
         yt_direction *= self.step_size
@@ -208,6 +436,14 @@ def clamp_to_boundaries(position, substrate, size, xt_direction, yt_direction):
     return new_x_clamped, new_y_clamped
 
 
+def choose_direction(uniform, weights):
+    """
+    Maps a uniform random number onto -1, 0 or +1 the way random.choices does with the same weights.
+    """
+    cum_weights = list(itertools.accumulate(weights))
+    return (-1, 0, 1)[bisect.bisect(cum_weights, uniform * (cum_weights[-1] + 0.0), 0, 2)]
+
+
 def probabilistic_density(potential, sigma):
     """
     Computes the value of the Gaussian probability density function at a given potential. Peaks at 0.
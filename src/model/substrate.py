@@ -6,6 +6,7 @@ import numpy as np
 import pandas as pd
 
 from build import config
+from model.potential_calculation import footprint_offsets
 
 
 class BaseSubstrate:
@@ -31,6 +32,15 @@ class BaseSubstrate:
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+        self.init_grids()
+
+        # Footprint fields per growth cone size, built lazily on first lookup
+        self._footprint_fields = {}
+
+    def init_grids(self):
+        """
+        Allocate the ligand and receptor grids.
+        """
         self.ligands = np.zeros((self.rows, self.cols), dtype=float)
         self.receptors = np.zeros((self.rows, self.cols), dtype=float)
 
@@ -56,6 +66,38 @@ class BaseSubstrate:
         result += str(receptors_df)
         return result
 
+    def get_footprint_fields(self, gc_size):
+        """
+        Return the ligand and receptor sums under the circular footprint of a growth cone at every substrate cell.
+        The fields are built on first request and cached, so all simulations sharing this substrate reuse them.
+
+        :param gc_size: Radius of the growth cone.
+        :return: Tuple of ligand and receptor fields, indexed by [y, x] of the footprint center.
+        """
+        fields = self._footprint_fields.get(gc_size)
+        if fields is None:
+            fields = self.build_footprint_fields(gc_size)
+            self._footprint_fields[gc_size] = fields
+        return fields
+
+    def build_footprint_fields(self, gc_size):
+        """
+        Build the ligand and receptor footprint fields for a growth cone size.
+        """
+        return footprint_field(self.ligands, gc_size), footprint_field(self.receptors, gc_size)
+
+    def footprint_sums(self, pos, gc_size):
+        """
+        Look up the ligand and receptor sums under the footprint of a growth cone centered at pos.
+
+        :return: Tuple of ligand and receptor sums, or None if the footprint is cut off by the substrate border.
+        """
+        x, y = pos
+        if not (gc_size <= x < self.cols - gc_size and gc_size <= y < self.rows - gc_size):
+            return None
+        ligand_field, receptor_field = self.get_footprint_fields(gc_size)
+        return ligand_field[y, x], receptor_field[y, x]
+
     def set_col_ligand_only(self, col):
         self.ligands[:, col] = np.ones(self.rows)
         self.receptors[:, col] = np.zeros(self.rows)
@@ -81,7 +123,70 @@ class BaseSubstrate:
         self.receptors[row, :] = np.zeros(self.cols)
 
 
-class ContinuousGradientSubstrate(BaseSubstrate):
+class SeparableSubstrate(BaseSubstrate):
+    """
+    Base class for substrates whose signals vary along a single axis only. Only the 1D ligand and receptor
+    profiles along that axis are stored; the 2D grids are exposed as read-only broadcast views.
+
+    Attributes:
+        axis (int): Grid axis along which the signals vary (0: along rows, 1: along columns).
+        ligand_profile (np.ndarray): Ligand values along the axis.
+        receptor_profile (np.ndarray): Receptor values along the axis.
+    """
+    axis = 1
+
+    def init_grids(self):
+        length = self.rows if self.axis == 0 else self.cols
+        self.ligand_profile = np.zeros(length, dtype=float)
+        self.receptor_profile = np.zeros(length, dtype=float)
+
+    @property
+    def ligands(self):
+        return self.broadcast_profile(self.ligand_profile)
+
+    @property
+    def receptors(self):
+        return self.broadcast_profile(self.receptor_profile)
+
+    def broadcast_profile(self, profile):
+        """
+        Expand a profile along the axis to a read-only view with the shape of the substrate grid.
+        """
+        if self.axis == 0:
+            profile = profile[:, np.newaxis]
+        return np.broadcast_to(profile, (self.rows, self.cols))
+
+    def build_footprint_fields(self, gc_size):
+        ligand_field = profile_footprint_field(self.ligand_profile, gc_size, self.axis)
+        receptor_field = profile_footprint_field(self.receptor_profile, gc_size, self.axis)
+        return self.broadcast_profile(ligand_field), self.broadcast_profile(receptor_field)
+
+    def set_profile(self, axis, index, ligand, receptor):
+        if axis != self.axis:
+            raise ValueError(f"{type(self).__name__} only varies along axis {self.axis}")
+        self.ligand_profile[index] = ligand
+        self.receptor_profile[index] = receptor
+
+    def set_col_ligand_only(self, col):
+        self.set_profile(1, col, 1, 0)
+
+    def set_col_receptor_only(self, col):
+        self.set_profile(1, col, 0, 1)
+
+    def set_col_empty(self, col):
+        self.set_profile(1, col, 0, 0)
+
+    def set_row_ligand_only(self, row):
+        self.set_profile(0, row, 1, 0)
+
+    def set_row_receptor_only(self, row):
+        self.set_profile(0, row, 0, 1)
+
+    def set_row_empty(self, row):
+        self.set_profile(0, row, 0, 0)
+
+
+class ContinuousGradientSubstrate(SeparableSubstrate):
     def __init__(self, rows, cols, offset, **kwargs):
         # Initialize the superclass with all given keyword arguments
         super().__init__(rows, cols, offset, **kwargs)
@@ -108,9 +213,8 @@ class ContinuousGradientSubstrate(BaseSubstrate):
         ligand_gradient = np.concatenate([low_end, ligand_gradient, high_end])
         receptor_gradient = np.concatenate([high_end, receptor_gradient, low_end])
 
-        for row in range(self.rows):
-            self.ligands[row, :] = ligand_gradient
-            self.receptors[row, :] = receptor_gradient
+        self.ligand_profile[:] = ligand_gradient
+        self.receptor_profile[:] = receptor_gradient
 
 
 class WedgeSubstrate(BaseSubstrate):
@@ -166,7 +270,9 @@ class WedgeSubstrate(BaseSubstrate):
         self.receptors, self.ligands = receptors, ligands
 
 
-class StripeSubstrate(BaseSubstrate):
+class StripeSubstrate(SeparableSubstrate):
+    axis = 0
+
     def __init__(self, rows, cols, offset, **kwargs):
         # Initialize the superclass with all given keyword arguments
         super().__init__(rows, cols, offset, **kwargs)
@@ -187,7 +293,7 @@ class StripeSubstrate(BaseSubstrate):
                     self.set_row_receptor_only(row)
 
 
-class GapSubstrate(BaseSubstrate):
+class GapSubstrate(SeparableSubstrate):
     def __init__(self, rows, cols, offset, **kwargs):
         # Initialize the superclass with all given keyword arguments
         super().__init__(rows, cols, offset, **kwargs)
@@ -225,3 +331,36 @@ class GapSubstrateInverted(GapSubstrate):
         second_part = first_part + int(self.cols * self.end)
         for col in range(first_part, second_part):
             self.set_col_receptor_only(col)
+
+
+def footprint_field(grid, gc_size):
+    """
+    Sum the grid under the circular growth cone footprint for every center not cut off by the grid border.
+    The cells are accumulated in the same order as ft_interaction_direct, so the sums are bit-identical.
+    """
+    rows, cols = grid.shape
+    field = np.zeros_like(grid)
+    if rows <= 2 * gc_size or cols <= 2 * gc_size:
+        return field
+
+    inner = field[gc_size:rows - gc_size, gc_size:cols - gc_size]
+    for di, dj in footprint_offsets(gc_size):
+        inner += grid[gc_size + di:rows - gc_size + di, gc_size + dj:cols - gc_size + dj]
+    return field
+
+
+def profile_footprint_field(profile, gc_size, axis):
+    """
+    Sum a 1D profile under the circular growth cone footprint for every center along the profile axis.
+    Equivalent to footprint_field on the broadcast grid, in the same accumulation order.
+    """
+    length = profile.shape[0]
+    field = np.zeros_like(profile)
+    if length <= 2 * gc_size:
+        return field
+
+    inner = field[gc_size:length - gc_size]
+    for offset in footprint_offsets(gc_size):
+        shift = offset[axis]
+        inner += profile[gc_size + shift:length - gc_size + shift]
+    return field
@@ -0,0 +1,151 @@
+"""
+Module providing the SynchronousSimulation class, which updates all growth cones of a step at once.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from build import config
+from model.array_simulation import ArraySimulation
+from model.potential_calculation import geometry_table, guidance_signals
+
+# Largest number of proposal and growth cone pairs compared directly, beyond that pairs are found by a k-d tree
+DENSE_PAIRS = 1 << 15
+
+
+class SynchronousSimulation(ArraySimulation):
+    """
+    Simulation with synchronous (Jacobi) updates. The sequential scheme of Simulation updates growth cones one after
+    another (Gauss-Seidel), so a growth cone sees the moves and adaptations of the growth cones before it in the
+    same step. Here, all growth cones adapt, then all propose a step against the same snapshot of positions and
+    signal values, all potentials are computed in one batch, and all accepted moves are applied at once.
+
+    This is a different update scheme, not a faster implementation of the sequential one: trajectories differ from
+    Simulation for the same random numbers, as growth cones react to their neighbours one step later.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.ff_mode != config.FF_PAIRWISE:
+            raise ValueError("Synchronous updates require pairwise fiber-fiber interaction")
+
+    def run_block(self, step_first, uniforms, active, records):
+        """
+        Run a block of synchronous steps, recording acceptance, positions and adapted values.
+        """
+        rec_accepted, rec_positions, rec_potentials = records[:3]
+        arrays = self.arrays
+        quantize = self.precision.quantize
+
+        for step in range(uniforms.shape[0]):
+            if self.adaptation:
+                ligands_new, receptors_new = self.adapt_block(active, records, step)
+                arrays.ligands[active] = ligands_new
+                arrays.receptors[active] = receptors_new
+            ligands = arrays.ligands[active]
+            receptors = arrays.receptors[active]
+
+            xs_new, ys_new = self.propose_block(uniforms[step], active)
+            xs_new = np.array(xs_new, dtype=np.int64)
+            ys_new = np.array(ys_new, dtype=np.int64)
+            ft_ligands, ft_receptors = self.ft_block(active, xs_new, ys_new)
+
+            ff_coef = 0
+            ff_ligands = ff_receptors = np.zeros(len(active))
+            if self.ff_inter:
+                ff_coef = self.ff_coefs[step_first + step]
+                ff_ligands, ff_receptors = self.ff_sums_batch(active, xs_new, ys_new)
+
+            forward_sig, reverse_sig = guidance_signals(ligands, receptors, np.asarray(ft_ligands),
+                                                        np.asarray(ft_receptors), ff_ligands, ff_receptors, ff_coef,
+                                                        self.forward_sig, self.reverse_sig, np.zeros(len(active)))
+            potentials_new = signal_potentials(forward_sig, reverse_sig, quantize)
+
+            accepted = np.ones(len(active), dtype=np.bool_)
+            if not self.force:
+                old_density = self.densities(arrays.potentials[active])
+                new_density = self.densities(potentials_new)
+                density_sum = old_density + new_density
+                probability = np.divide(old_density, density_sum, out=np.full(len(active), 0.5),
+                                        where=density_sum != 0)
+                accepted = uniforms[step, :, 2] > probability
+
+            moved = active[accepted]
+            arrays.xs[moved] = xs_new[accepted]
+            arrays.ys[moved] = ys_new[accepted]
+            arrays.potentials[moved] = potentials_new[accepted]
+            arrays.windows[moved, arrays.window_counts[moved] % arrays.windows.shape[1]] = potentials_new[accepted]
+            arrays.window_counts[moved] += 1
+            rec_accepted[step, moved] = True
+            rec_positions[step, moved, 0] = xs_new[accepted]
+            rec_positions[step, moved, 1] = ys_new[accepted]
+            rec_potentials[step, moved] = potentials_new[accepted]
+
+    def ff_sums_batch(self, active, xs_new, ys_new):
+        """
+        Calculate the fiber-fiber sums of all active growth cones at their proposals against the snapshot of all
+        growth cone positions and signal values. Contributions are added in list order, like ff_interaction.
+        """
+        arrays = self.arrays
+        sums = np.zeros((2, len(active)))
+        sizes = arrays.sizes[active]
+
+        for size in set(sizes.tolist()):
+            group = np.flatnonzero(sizes == size)
+            areas = np.array(geometry_table(size).area, dtype=float)
+            proposals, others, d_squared = self.pairs_in_range(xs_new[group], ys_new[group], 2 * size)
+
+            # Drop self pairs and pairs out of range, then sort by proposal and list order
+            keep = (active[group][proposals] != others) & (d_squared < len(areas))
+            order = np.lexsort((others[keep], proposals[keep]))
+            proposals = proposals[keep][order]
+            others = others[keep][order]
+            area = areas[d_squared[keep][order]]
+
+            # bincount adds the weights of every bin one after another, in the given order
+            sums[0, group] = np.bincount(proposals, area * arrays.ligands[others], minlength=len(group))
+            sums[1, group] = np.bincount(proposals, area * arrays.receptors[others], minlength=len(group))
+
+        return sums[0], sums[1]
+
+    def pairs_in_range(self, xs, ys, distance):
+        """
+        Find all pairs of positions and growth cones closer than a distance.
+
+        :return: Tuple of the position indexes, growth cone indexes and squared offsets of every pair.
+        """
+        arrays = self.arrays
+        if len(xs) * len(arrays.xs) <= DENSE_PAIRS:
+            dx = arrays.xs[np.newaxis, :] - xs[:, np.newaxis]
+            dy = arrays.ys[np.newaxis, :] - ys[:, np.newaxis]
+            d_squared = dx * dx + dy * dy
+            proposals, others = np.nonzero(d_squared < distance * distance)
+            return proposals, others, d_squared[proposals, others]
+
+        points = np.column_stack((xs, ys))
+        cones = np.column_stack((arrays.xs, arrays.ys))
+        pairs = cKDTree(points).sparse_distance_matrix(cKDTree(cones), distance, output_type="ndarray")
+        proposals = pairs["i"].astype(np.int64)
+        others = pairs["j"].astype(np.int64)
+        dx = arrays.xs[others] - xs[proposals]
+        dy = arrays.ys[others] - ys[proposals]
+        return proposals, others, dx * dx + dy * dy
+
+    def densities(self, potentials):
+        """
+        Compute probabilistic_density for an array of potentials.
+        """
+        return np.exp(-potentials ** 2 / self.density_denominator) / self.density_norm
+
+
+def signal_potentials(forward_sigs, reverse_sigs, quantize):
+    """
+    Calculate the guidance potentials for arrays of forward and reverse signals, see signal_potential.
+    """
+    forward_sigs = np.array([quantize(value) for value in forward_sigs.tolist()], dtype=float)
+    reverse_sigs = np.array([quantize(value) for value in reverse_sigs.tolist()], dtype=float)
+
+    potentials = np.abs(np.log(np.where(reverse_sigs == 0, 0.0001, reverse_sigs))
+                        - np.log(np.where(forward_sigs == 0, 0.0001, forward_sigs)))
+    potentials[(forward_sigs == 0) & (reverse_sigs == 0)] = 0
+    return potentials
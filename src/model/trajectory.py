@@ -0,0 +1,188 @@
+"""
+Module providing the move-encoded storage of growth cone trajectories.
+"""
+
+import numpy as np
+
+from build import config
+
+CHUNK = 256  # entries per checkpoint of the seek index
+ESCAPE = 15  # move code of a displacement other than -step_size, 0 or +step_size on some axis
+
+
+class TrajectorySeries:
+    """
+    Position series of a growth cone history that stores the moves instead of the positions. An accepted step
+    changes every coordinate by -step_size, 0 or +step_size, so the move to an entry is one of nine 4-bit codes,
+    3 * code(dx) + code(dy), two of them packed per byte. Displacements that are no such move, e.g. clamped at a
+    boundary with step_size > 1, get the escape code and are kept apart.
+
+    Positions are decoded by cumulative sums over the moves. Every CHUNK-th position is kept as a checkpoint, so a
+    single entry is decoded from the checkpoint before it, whatever the length of the trajectory.
+
+    Has the interface of Series at HISTORY_FULL, the only level it is used at.
+
+    Attributes:
+        step_size (int): Magnitude of a move on one axis.
+        codes (np.ndarray): Packed move codes, the move to entry i in the low (even i) or high (odd i) half of byte
+            i // 2.
+        checkpoints (np.ndarray): Positions of the entries 0, CHUNK, 2 * CHUNK, ..., with room for every entry the
+            codes have room for.
+        escapes (dict): Displacements with the escape code, by entry.
+        size (int): Number of recorded entries.
+        count (int): Number of appended entries, all of them recorded.
+        first (tuple): Initial position.
+        last (tuple): Latest position.
+    """
+
+    def __init__(self, first, step_size):
+        self.step_size = step_size
+        self.codes = np.zeros(1, dtype=np.uint8)
+        self.checkpoints = np.empty((1, 2), dtype=np.int64)
+        self.checkpoints[0] = first
+        self.escapes = {}
+        self.size = 1
+        self.count = 1
+        self.first = first
+        self.last = tuple(first)
+
+        # Displacement of every code, zero for the escape code whose displacement is looked up in escapes
+        self.moves = np.zeros((16, 2), dtype=np.int64)
+        for code in range(9):
+            self.moves[code] = self.axis_move(code // 3), self.axis_move(code % 3)
+        self.codebook = {tuple(self.moves[code].tolist()): code for code in range(9)}
+
+    def axis_move(self, axis_code):
+        """
+        Return the displacement on one axis encoded by 0 (none), 1 (+step_size) or 2 (-step_size).
+        """
+        return (0, self.step_size, -self.step_size)[axis_code]
+
+    def view(self):
+        """
+        Return the recorded positions, decoded into a new array on every call.
+        """
+        return self.decode(0, self.count)
+
+    def detach(self):
+        """
+        Return the series holding its recorded entries in memory, itself.
+        """
+        return self
+
+    def configure(self, level, interval=1, keep=0):
+        """
+        Accept the full recording level only, as positions are decoded from every move.
+        """
+        if level != config.HISTORY_FULL:
+            raise ValueError("Move-encoded trajectories record every entry")
+
+    def reserve(self, entries):
+        """
+        Preallocate room for the moves of a number of entries to come.
+        """
+        needed = (self.count + entries) // 2 + 1
+        if needed > len(self.codes):
+            self.resize(needed)
+
+    def resize(self, capacity):
+        """
+        Move the packed codes into storage of a new capacity in bytes, and the checkpoints into storage for the
+        entries it holds.
+        """
+        codes = np.zeros(capacity, dtype=np.uint8)
+        codes[:len(self.codes)] = self.codes[:capacity]
+        self.codes = codes
+        checkpoints = np.empty((2 * capacity // CHUNK + 1, 2), dtype=np.int64)
+        kept = min(len(checkpoints), len(self.checkpoints))
+        checkpoints[:kept] = self.checkpoints[:kept]
+        self.checkpoints = checkpoints
+
+    def append(self, value):
+        """
+        Append a position.
+        """
+        x, y = int(value[0]), int(value[1])
+        delta = x - self.last[0], y - self.last[1]
+        index = self.count
+        code = self.codebook.get(delta, ESCAPE)
+        if code == ESCAPE:
+            self.escapes[index] = delta
+
+        if index // 2 == len(self.codes):
+            self.resize(2 * len(self.codes))
+        self.codes[index // 2] |= code << 4 * (index % 2)
+        if index % CHUNK == 0:
+            self.checkpoints[index // CHUNK] = x, y
+
+        self.count += 1
+        self.size = self.count
+        self.last = x, y
+
+    def extend(self, values):
+        """
+        Append an array of positions, e.g. the records of an array engine block.
+        """
+        values = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+        if not len(values):
+            return
+        indexes = np.arange(self.count, self.count + len(values))
+        deltas = np.diff(values, axis=0, prepend=np.array([self.last], dtype=np.int64))
+
+        # Axis codes 0, 1 and 2 for no move, +step_size and -step_size, 3 for any other displacement
+        axis_codes = np.full(deltas.shape, 3, dtype=np.uint8)
+        axis_codes[deltas == 0] = 0
+        axis_codes[deltas == self.step_size] = 1
+        axis_codes[deltas == -self.step_size] = 2
+        codes = 3 * axis_codes[:, 0] + axis_codes[:, 1]
+        escaped = (axis_codes == 3).any(axis=1)
+        codes[escaped] = ESCAPE
+        for index, delta in zip(indexes[escaped].tolist(), deltas[escaped].tolist()):
+            self.escapes[index] = tuple(delta)
+
+        needed = indexes[-1] // 2 + 1
+        if needed > len(self.codes):
+            self.resize(max(2 * len(self.codes), needed))
+        np.bitwise_or.at(self.codes, indexes // 2, codes << (4 * (indexes % 2)).astype(np.uint8))
+
+        checkpointed = indexes % CHUNK == 0
+        self.checkpoints[indexes[checkpointed] // CHUNK] = values[checkpointed]
+
+        self.count += len(values)
+        self.size = self.count
+        self.last = tuple(values[-1].tolist())
+
+    def latest(self, n):
+        """
+        Return up to the n latest positions as a list.
+        """
+        n = min(n, self.count)
+        if n <= 0:
+            return []
+        return self.decode(self.count - n, self.count).tolist()
+
+    def at(self, index):
+        """
+        Return the position of one entry, decoded from the checkpoint before it.
+        """
+        if not -self.count <= index < self.count:
+            raise IndexError("Trajectory index out of range")
+        return tuple(self.decode(index % self.count, index % self.count + 1)[0].tolist())
+
+    def decode(self, start, stop):
+        """
+        Decode the positions of the entries start to stop - 1, from the checkpoint at or before start.
+        """
+        if stop <= start:
+            return np.empty((0, 2), dtype=np.int64)
+        base = start - start % CHUNK
+        indexes = np.arange(base + 1, stop)
+        codes = (self.codes[indexes // 2] >> (4 * (indexes % 2)).astype(np.uint8)) & 0xF
+        deltas = self.moves[codes]
+        for offset in np.flatnonzero(codes == ESCAPE).tolist():
+            deltas[offset] = self.escapes[base + 1 + offset]
+
+        positions = np.empty((stop - base, 2), dtype=np.int64)
+        positions[0] = self.checkpoints[base // CHUNK]
+        positions[1:] = positions[0] + np.cumsum(deltas, axis=0)
+        return positions[start - base:]
@@ -0,0 +1,41 @@
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from build import config, object_factory  # noqa: E402
+
+
+def run_config(**overrides):
+    """
+    Short run of the continuous gradients configuration, with the settings keyed by the config constants overridden.
+    """
+    run = dict(config.default_configs["CONTINUOUS_GRADIENTS"])
+    run.update({config.GC_COUNT: 16, config.STEP_NUM: 200, config.SEED: 1})
+    run.update(overrides)
+    return run
+
+
+def run_simulation(simulation):
+    """
+    Runs the simulation without printing its progress and returns the result.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return simulation.run()
+
+
+def simulate(**overrides):
+    """
+    Builds and runs the simulation of run_config(**overrides) and returns the simulation and its result.
+    """
+    simulation = object_factory.build_simulation(run_config(**overrides))
+    return simulation, run_simulation(simulation)
+
+
+def final_state(result):
+    """
+    Final positions and potentials of the growth cones of a result.
+    """
+    return [tuple(gc.pos) for gc in result.gcs], [gc.potential for gc in result.gcs]
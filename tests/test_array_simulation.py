@@ -0,0 +1,15 @@
+import pytest
+
+from build import config
+from conftest import final_state, simulate
+from model import array_simulation
+
+
+def run(**overrides):
+    return final_state(simulate(**dict({config.GC_COUNT: 40, config.SEED: 3}, **overrides))[1])
+
+
+@pytest.mark.parametrize("cell_index_gcs", [0, 10 ** 9])
+def test_array_engine_matches_object_engine(monkeypatch, cell_index_gcs):
+    monkeypatch.setattr(array_simulation, "CELL_INDEX_GCS", cell_index_gcs)
+    assert run(**{config.ENGINE: config.ENGINE_ARRAY}) == run()
@@ -0,0 +1,38 @@
+import pytest
+
+from build import config, object_factory
+from conftest import run_config, simulate
+from model.backends import BACKENDS, check_conformance
+
+
+RUN = {config.GC_COUNT: 20, config.STEP_NUM: 150, config.SEED: 11}
+
+
+@pytest.fixture(scope="module")
+def simulated():
+    """
+    Growth cones and substrate after a short run, with adapted signals and crowded positions.
+    """
+    simulation, _ = simulate(**RUN)
+    return simulation.substrate, simulation.growth_cones
+
+
+@pytest.fixture(scope="module")
+def initial():
+    """
+    Growth cones and substrate before the first step, placed at the border of the substrate.
+    """
+    simulation = object_factory.build_simulation(run_config(**RUN, **{config.GC_SIZE: 4}))
+    return simulation.substrate, simulation.growth_cones
+
+
+@pytest.mark.parametrize("name", sorted(BACKENDS))
+@pytest.mark.parametrize("state", ["initial", "simulated"])
+def test_backend_conforms(name, state, request):
+    substrate, growth_cones = request.getfixturevalue(state)
+    assert check_conformance(BACKENDS[name], substrate, growth_cones, step=75, num_steps=150) == []
+
+
+def test_numba_backend_registered():
+    pytest.importorskip("numba")
+    assert config.BACKEND_NUMBA in BACKENDS
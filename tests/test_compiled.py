@@ -0,0 +1,24 @@
+import random
+
+from build import config
+from conftest import simulate
+from model.compiled import round_6
+
+
+def test_kernel_rounding_matches_python():
+    rng = random.Random(5)
+    values = [rng.uniform(-10, 10) for _ in range(100000)]
+    values += [k / 10 ** 6 + 5e-7 for k in range(-20000, 20000)]  # next to a rounding tie
+    values += [rng.uniform(-1e10, 1e10) for _ in range(10000)]
+    values += [0.0, -0.0, -1e-9, 1 / 128, -3 / 128, 2.0 ** 33 - 2.0 ** -10, 1e-300]
+    for value in values:
+        assert repr(round_6(value)) == repr(round(value, 6))
+
+
+def test_compiled_engine_matches_object_engine():
+    objects, compiled = [simulate(**{config.STEP_NUM: 300, config.ENGINE: engine})[1]
+                         for engine in (config.ENGINE_OBJECT, config.ENGINE_COMPILED)]
+    assert [tuple(gc.pos) for gc in objects.gcs] == [tuple(gc.pos) for gc in compiled.gcs]
+    assert [gc.potential for gc in objects.gcs] == [gc.potential for gc in compiled.gcs]
+    assert [gc.history.potential.tolist() for gc in objects.gcs] == \
+           [gc.history.potential.tolist() for gc in compiled.gcs]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from build import config
+from conftest import final_state, simulate
+from model import array_simulation, decomposed
+
+DECOMPOSED = {config.ENGINE: config.ENGINE_DECOMPOSED, config.GC_COUNT: 24}
+
+
+def sequential_step(self, step, step_abs, active):
+    """
+    Step of DecomposedSimulation.run_step as a sequential sweep in this process: the growth cones of even strips,
+    then of odd strips, each in list order, over the whole state.
+    """
+    shared = self.shared
+    areas, grids, params = self.kernel_tables()
+    strips = np.minimum(shared["ys"][active] // self.strip_height, len(self.connections) - 1)
+    for colour in (0, 1):
+        positions = np.flatnonzero(strips % 2 == colour)
+        owned = active[positions]
+        state = [shared[name] for name in decomposed.STATE]
+        records = array_simulation.allocate_records(1, len(self.growth_cones))
+        decomposed.run_block(shared["ff_coefs"][step_abs:step_abs + 1], shared["uniforms"][step:step + 1, positions],
+                             owned, *state, *records, areas, *grids, *params)
+        for name, record in zip(decomposed.RECORDS, records):
+            shared[name][step, owned] = record[0, owned]
+
+
+def run(**overrides):
+    simulation, result = simulate(**DECOMPOSED, **overrides)
+    assert simulation.strip_count() >= 2
+    return final_state(result), [gc.history.potential.tolist() for gc in result.gcs]
+
+
+def test_without_numba_falls_back_to_array_engine(monkeypatch):
+    monkeypatch.setattr(decomposed, "numba", None)
+    assert final_state(simulate(**{config.ENGINE: config.ENGINE_DECOMPOSED})[1]) == \
+           final_state(simulate(**{config.ENGINE: config.ENGINE_ARRAY})[1])
+
+
+def test_runs_are_reproducible():
+    pytest.importorskip("numba")
+    assert run() == run()
+
+
+def test_matches_sequential_sweep_by_strip_colour(monkeypatch):
+    pytest.importorskip("numba")
+    strips = run()
+    monkeypatch.setattr(decomposed.DecomposedSimulation, "run_step", sequential_step)
+    assert run() == strips
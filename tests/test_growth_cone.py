@@ -0,0 +1,34 @@
+import random
+
+import numpy as np
+import pytest
+
+from build import config
+from conftest import final_state, simulate
+from model.growth_cone import AdaptationWindow
+
+HISTORY_NAMES = ("potential", "adap_co", "ligand", "receptor")
+
+
+@pytest.mark.parametrize("h", [1, 2, 7, 50])
+def test_window_matches_direct_weighted_sum(h):
+    rng = random.Random(h)
+    potentials = [rng.uniform(-5, 5) for _ in range(h)]
+    window = AdaptationWindow(potentials, h)
+    for _ in range(5 * h + 3):
+        potentials.append(rng.uniform(-5, 5) * 10 ** rng.randint(-6, 3))
+        window.push(potentials[-1])
+        latest = potentials[-h:]
+        assert window.weighted == sum(k * abs(potential) for k, potential in enumerate(latest, 1))
+
+
+@pytest.mark.parametrize("engine", [config.ENGINE_ARRAY, config.ENGINE_COMPILED])
+def test_float64_object_engine_matches(engine):
+    run = {config.GC_COUNT: 20, config.STEP_NUM: 300, config.SEED: 4, config.PRECISION: config.PRECISION_FLOAT64}
+    objects = simulate(**run)[1]
+    others = simulate(**run, **{config.ENGINE: engine})[1]
+
+    assert final_state(objects) == final_state(others)
+    for name in HISTORY_NAMES:
+        for ours, theirs in zip(objects.gcs, others.gcs):
+            assert np.array_equal(ours.history.series[name].view(), theirs.history.series[name].view())
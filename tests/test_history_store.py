@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from build import config
+from conftest import simulate
+from model.history_store import HistoryStore, StreamedSeries
+
+
+def streamed_simulation(directory):
+    return simulate(**{config.GC_COUNT: 6, config.STEP_NUM: 300, config.SEED: 2, config.HISTORY_DIRECTORY: directory,
+                       config.HISTORY_CHUNK: 64})
+
+
+def test_writer_errors_are_raised_from_wait_and_close(tmp_path):
+    store = HistoryStore(str(tmp_path), {"potential": (10, (), np.float64)}, 2, chunk=4)
+    store.submit("potential", 0, 0, np.zeros((4, 3)))  # entries of the wrong shape
+    store.submit("potential", 1, 0, np.ones(4))
+
+    with pytest.raises(ValueError):
+        store.wait()
+    with pytest.raises(ValueError):
+        store.close()
+    assert np.array_equal(store.maps["potential"][1, :4], np.ones(4))
+
+
+def test_detach_keeps_entries_in_the_memory_map(tmp_path):
+    simulation, result = streamed_simulation(str(tmp_path))
+    history = result.gcs[0].history
+    assert isinstance(history.series["potential"], StreamedSeries)
+    recorded = np.array(history.series["potential"].view())
+
+    history.configure(config.HISTORY_FINAL)
+    detached = history.series["potential"]
+    assert np.shares_memory(detached.values, result.history_store.maps["potential"])
+    assert np.array_equal(detached.view(), recorded)
+
+    detached.append(1.5)
+    assert not np.shares_memory(detached.values, result.history_store.maps["potential"])
+    assert detached.view()[-1] == 1.5
+    assert np.array_equal(HistoryStore.open(result.history_store.directory).series("potential", 0), recorded)
+
+
+def test_replay_of_streamed_run_writes_no_files(tmp_path):
+    _, result = streamed_simulation(str(tmp_path))
+    files = sorted(tmp_path.rglob("*"))
+
+    replay = result.replay([0])
+    assert sorted(tmp_path.rglob("*")) == files
+    assert not isinstance(replay.gcs[0].history.series["potential"], StreamedSeries)
+    assert np.array_equal(replay.gcs[0].history.series["potential"].view(),
+                          result.gcs[0].history.series["potential"].view())
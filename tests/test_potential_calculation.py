@@ -0,0 +1,25 @@
+import pytest
+
+from build import config
+from conftest import simulate
+
+
+@pytest.mark.parametrize("overrides, border", [({config.STEP_NUM: 150}, False),
+                                               ({config.STEP_NUM: 3, config.GC_SIZE: 4}, True)],
+                         ids=["simulated", "border"])
+def test_batch_matches_per_position_potentials(overrides, border):
+    simulation, _ = simulate(**overrides)
+    step = simulation.num_steps - 1
+    clamped = 0
+    for gc in simulation.growth_cones:
+        positions, potentials = simulation.candidate_potentials(gc, step)
+        clamped += len(set(positions)) < len(positions)
+        expected = [simulation.backend.calculate_potential(gc, pos, simulation.growth_cones, simulation.substrate,
+                                                           simulation.forward_sig, simulation.reverse_sig,
+                                                           simulation.ff_inter, simulation.ft_inter, step,
+                                                           simulation.num_steps, simulation.sigmoid_steepness,
+                                                           simulation.sigmoid_shift, simulation.ff_source(),
+                                                           simulation.precision.quantize)
+                    for pos in positions]
+        assert potentials.tolist() == expected
+    assert clamped or not border  # positions clamped to the substrate
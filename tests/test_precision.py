@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+import pytest
+
+from build import config, object_factory
+from conftest import run_config, run_simulation
+from model.precision import PrecisionPolicy, get_precision_policy, quantize_legacy
+
+HISTORY_NAMES = ("potential", "adap_co", "ligand", "receptor")
+
+
+def quantize_format(value):
+    """
+    Quantization of the original model, through a string round trip.
+    """
+    return float("{:.6f}".format(value))
+
+
+def build(**overrides):
+    return object_factory.build_simulation(run_config(**dict({config.GC_COUNT: 12, config.STEP_NUM: 300,
+                                                              config.SEED: 7}, **overrides)))
+
+
+def history_values(result, name):
+    return [np.asarray(gc.history.series[name].view()) for gc in result.gcs]
+
+
+def test_legacy_quantize_matches_format():
+    rng = random.Random(3)
+    values = [rng.uniform(-10, 10) for _ in range(100000)]
+    values += [k / 10 ** 7 + 5e-7 for k in range(-1000, 1000)]  # decimal ties, inexact in binary
+    values += [0.0, -0.0, 1e-7, 0.0000005, 0.0000015, 2.5e-6, 1234567.8912345]
+    assert [quantize_legacy(value) for value in values] == [quantize_format(value) for value in values]
+
+
+@pytest.mark.parametrize("engine", [config.ENGINE_OBJECT, config.ENGINE_ARRAY])
+def test_legacy_run_matches_format_path(engine):
+    legacy = run_simulation(build(**{config.ENGINE: engine}))
+
+    simulation = build(**{config.ENGINE: engine})
+    simulation.precision = PrecisionPolicy(config.PRECISION_LEGACY, quantize_format, np.float64)
+    for gc in simulation.growth_cones:
+        gc.quantize = quantize_format
+    baseline = run_simulation(simulation)
+
+    assert [tuple(gc.pos) for gc in legacy.gcs] == [tuple(gc.pos) for gc in baseline.gcs]
+    for name in HISTORY_NAMES:
+        for ours, theirs in zip(history_values(legacy, name), history_values(baseline, name)):
+            assert np.array_equal(ours, theirs)
+
+
+def test_float32_histories_use_policy_dtype():
+    results = [run_simulation(build(**{config.PRECISION: config.PRECISION_FLOAT32, config.ENGINE: engine}))
+               for engine in (config.ENGINE_OBJECT, config.ENGINE_ARRAY)]
+
+    for name in HISTORY_NAMES:
+        for values in history_values(results[0], name):
+            assert values.dtype == get_precision_policy(config.PRECISION_FLOAT32).dtype
+    assert [tuple(gc.pos) for gc in results[0].gcs] == [tuple(gc.pos) for gc in results[1].gcs]
+    for name in HISTORY_NAMES:
+        for ours, theirs in zip(history_values(results[0], name), history_values(results[1], name)):
+            assert np.array_equal(ours, theirs)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from model.trajectory import CHUNK, TrajectorySeries
+
+
+def random_walk(rng, first, steps, step_size):
+    moves = rng.integers(-1, 2, size=(steps, 2)) * step_size
+    moves[rng.random(steps) < 0.02] = (step_size + 1, 0)  # displacements that need the escape code
+    return first + np.cumsum(moves, axis=0)
+
+
+def test_append_and_extend_decode_to_positions():
+    rng = np.random.default_rng(2)
+    first = np.array([50, 50])
+    positions = random_walk(rng, first, 5 * CHUNK + 17, 2)
+
+    series = TrajectorySeries(tuple(first), 2)
+    for position in positions[:CHUNK + 3]:
+        series.append(position)
+    series.extend(positions[CHUNK + 3:3 * CHUNK])
+    series.reserve(len(positions))
+    series.extend(positions[3 * CHUNK:])
+
+    expected = np.vstack([first, positions])
+    assert np.array_equal(series.view(), expected)
+    assert series.latest(CHUNK + 5) == expected[-CHUNK - 5:].tolist()
+    for index in (0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 3 * CHUNK, len(expected) - 1, -1):
+        assert series.at(index) == tuple(expected[index].tolist())
+
+
+def test_view_is_not_cached():
+    series = TrajectorySeries((0, 0), 1)
+    series.extend([(1, 0), (1, 1)])
+    view = series.view()
+    view[0] = (9, 9)
+    assert series.view().tolist() == [[0, 0], [1, 0], [1, 1]]